@@ -1,34 +1,133 @@
 # app.py
 import os
+import hmac
+import json
+import time
 import uuid
-from flask import Flask, render_template, request, jsonify, url_for
+import logging
+import threading
+from flask import Flask, render_template, request, jsonify, url_for, Response
 from dotenv import load_dotenv
 
 load_dotenv()
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(module)s:%(lineno)d - %(message)s',
+    level=logging.INFO
+)
 from bot_logic import BotLogic, logger
+from session_store import CarriedSessionStore, SessionTokenSigner
+from metrics import PROMETHEUS_CONTENT_TYPE
+from assets import AssetManifest
+from reply_cache import ReplyCache, body_etag
+
+PARKING_STREAM_KEEPALIVE_SECONDS = 15
+# Streams are closed after this long so a held worker is eventually freed; EventSource reconnects on its own
+PARKING_STREAM_MAX_SECONDS = int(os.getenv("PARKING_STREAM_MAX_SECONDS", "600"))
+# Every open stream holds a worker thread, so only this many run at once; other viewers are told to poll
+# /parking/live instead. Serverless functions can't hold a stream at all, so on Vercel the default is polling only.
+PARKING_STREAM_MAX_SUBSCRIBERS = int(os.getenv("PARKING_STREAM_MAX_SUBSCRIBERS", "0" if os.getenv("VERCEL") else "4"))
+PARKING_LIVE_POLL_SECONDS = 15
+_parking_stream_slots, _parking_stream_lock = [0], threading.Lock()
+
+ASSET_MANIFEST = AssetManifest.load()
+# Serialized /ask replies that are a pure function of (menu level, input, language, data versions); see BotLogic.reply_cache_key
+reply_cache = ReplyCache(max_entries=int(os.getenv("REPLY_CACHE_SIZE", "2048")))
+# Kiosks and the SMS gateway forward queued messages through /ask/batch; bounds the time one request holds a worker
+ASK_BATCH_MAX_MESSAGES = int(os.getenv("ASK_BATCH_MAX_MESSAGES", "200"))
 
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "a-strong-default-secret-key-for-development")
 
-bot_logic = BotLogic()
-logger.info("BotLogic initialized for the web application.")
+# SESSION_STORE=token: the conversation state rides along with every request as a signed token, so any
+# instance can answer any message and nothing is stored server-side.
+TOKEN_SESSIONS = os.getenv("SESSION_STORE", "memory").lower() == "token"
+session_signer = SessionTokenSigner(app.secret_key)
+
+def _carried_session(user_id, token):
+    # None outside token mode (BotLogic uses its own store); an unverifiable token starts a fresh conversation
+    if not TOKEN_SESSIONS: return None
+    state = session_signer.verify(token) if token else None
+    if token and state is None: logger.info("Ignoring session token with a bad signature; starting a new session.")
+    return CarriedSessionStore(user_id, state)
+
+# BotLogic authorizes with Google and preloads the sheets, so it is built on first use instead of at import.
+# BOT_WARMUP=background starts building it right away on a thread, overlapping the work with server start-up.
+_bot_logic, _bot_logic_lock = None, threading.Lock()
+
+def get_bot_logic() -> BotLogic:
+    global _bot_logic
+    if _bot_logic is None:
+        with _bot_logic_lock:
+            if _bot_logic is None:
+                started = time.perf_counter()
+                instance = BotLogic()
+                if os.getenv("BOT_BACKGROUND_REFRESH", "").lower() in ("1", "true", "yes"):
+                    instance.start_background_refresh()
+                _bot_logic = instance
+                logger.info(f"BotLogic initialized for the web application in {time.perf_counter() - started:.2f}s.")
+    return _bot_logic
+
+if os.getenv("BOT_WARMUP", "lazy").lower() == "background":
+    threading.Thread(target=get_bot_logic, name="BotLogicWarmup", daemon=True).start()
 
 @app.route('/')
 def index():
+    bot_logic = get_bot_logic()
     user_id = str(uuid.uuid4())
+    carried = _carried_session(user_id, None)
     # This now uses the initial response from the bot logic directly
     initial_response = bot_logic.process_user_input(
-        user_id=user_id, input_type='command', data='start_session_command', user_name='Visitor'
+        user_id=user_id, input_type='command', data='start_session_command', user_name='Visitor', session_store=carried
     )
     return render_template(
         'index.html', user_id=user_id,
+        state_token=session_signer.sign(carried.get(user_id)) if carried else None, token_sessions=TOKEN_SESSIONS,
+        parking_streaming=PARKING_STREAM_MAX_SUBSCRIBERS > 0, parking_poll_seconds=PARKING_LIVE_POLL_SECONDS,
         initial_text=initial_response.get("text", "Hello!"),
         initial_buttons=initial_response.get("buttons", [])
     )
 
-@app.route('/ask', methods=['POST'])
-def ask():
-    data = request.get_json()
+def _photo_sources(path):
+    # <picture> sources for a built image: content-hashed files under /static (cached as immutable, see vercel.json),
+    # most compact format first. The browser picks the type and width; images without a build get none.
+    picture = ASSET_MANIFEST.picture(path)
+    if picture is None: return url_for('static', filename=path), []
+    sources = [{'type': source['type'], 'srcset': ', '.join(f"{url_for('static', filename=file)} {width}w" for file, width in source['srcset'])}
+               for source in picture['sources']]
+    return url_for('static', filename=picture['src']), sources
+
+def _parse_location(raw):
+    # Optional {"lat": .., "lon": ..} from the browser's geolocation; returns None when absent or invalid
+    if not isinstance(raw, dict): return None
+    try:
+        lat, lon = float(raw.get('lat')), float(raw.get('lon'))
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180): return None
+    return lat, lon
+
+def _ask_payload():
+    # POST carries JSON; GET (token sessions only, where a reply changes no server state) carries query parameters.
+    # A location is only accepted in a POST body: in a URL it would end up in access logs and browser history.
+    if request.method == 'POST': return request.get_json()
+    args = request.args
+    return {'question': args.get('question', ''), 'user_id': args.get('user_id'), 'state_token': args.get('state_token')}
+
+def _json_reply(body, etag):
+    # GET replies are revalidated by the browser cache, so an unchanged reply costs a bodiless 304
+    if request.method == 'GET' and etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    if request.method == 'GET': response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/ask', methods=['GET', 'POST'])
+async def ask():
+    if request.method == 'GET' and not TOKEN_SESSIONS:
+        return jsonify({'error': 'GET /ask requires SESSION_STORE=token'}), 405
+    data = _ask_payload()
     user_input = data.get('question', '').strip()
     user_id = data.get('user_id')
     user_name = 'Visitor'
@@ -39,27 +138,170 @@ def ask():
     if not user_input and user_input != "start_session_command":
         return jsonify({'text': 'Please type a message.'})
 
-    response_dict = bot_logic.process_user_input(
-        user_id=user_id, input_type='text', data=user_input, user_name=user_name
+    location = _parse_location(data.get('location'))
+    if data.get('location') and not location:
+        return jsonify({'error': 'Invalid location'}), 400
+
+    bot_logic = get_bot_logic()
+    carried = _carried_session(user_id, data.get('state_token'))
+    cache_key, cached = _cached_reply(bot_logic, user_id, user_input, location, carried)
+    if cached is not None:
+        return _json_reply(cached.body, cached.etag)
+
+    response_dict = await bot_logic.process_user_input_async(
+        user_id=user_id, input_type='text', data=user_input, user_name=user_name, location=location, session_store=carried
     )
+    return _json_reply(*_finish_reply(bot_logic, user_id, response_dict, carried, cache_key))
+
+def _cached_reply(bot_logic, user_id, user_input, location, carried):
+    # (cache key or None, CachedReply or None); a hit has already replayed its session transition
+    cache_key = bot_logic.reply_cache_key(user_id, user_input, location, session_store=carried)
+    cached = reply_cache.get(cache_key) if cache_key is not None else None
+    if cache_key is not None:
+        bot_logic.metrics.inc("tirubot_cache_requests_total", cache="reply", result="hit" if cached else "miss")
+    if cached is not None:
+        bot_logic.apply_reply_transition(user_id, cached.next_state, session_store=carried)
+    return cache_key, cached
 
-    # Convert relative photo paths to full, usable URLs
+def _finish_reply(bot_logic, user_id, response_dict, carried, cache_key):
+    # Serializes a fresh reply for the client and stores it in the reply cache when it is cacheable; returns (body, etag)
+    if carried is not None:
+        response_dict['state_token'] = session_signer.sign(carried.get(user_id))
+
+    # Convert relative photo paths to full, usable URLs; photo_sources[i] lists the <picture> sources for photos[i]
     if 'photos' in response_dict and response_dict.get('photos'):
-        response_dict['photos'] = [
-            url_for('static', filename=path) for path in response_dict['photos']
-        ]
+        pictures = [_photo_sources(path) for path in response_dict['photos']]
+        response_dict['photos'] = [src for src, _ in pictures]
+        response_dict['photo_sources'] = [sources for _, sources in pictures]
 
     # Handle appending the next menu if the flag is set
     if 'next_menu' in response_dict:
         menu_type = response_dict.pop('next_menu') 
-        menu_text = bot_logic._get_menu_text(menu_type, user_id)
+        menu_text = bot_logic._get_menu_text(menu_type, (carried.get(user_id) or {}).get('lang', 'en') if carried else user_id)
         
         if response_dict.get('text'):
             response_dict['text'] += f"\n\n{menu_text}"
         else:
             response_dict['text'] = menu_text
 
-    return jsonify(response_dict)
+    body = (app.json.dumps(response_dict) + "\n").encode('utf-8')
+    next_state = (bot_logic.user_states if carried is None else carried).get(user_id)
+    if cache_key is not None and next_state is not None:
+        return body, reply_cache.put(cache_key, body, next_state).etag
+    return body, body_etag(body)
+
+@app.route('/ask/batch', methods=['POST'])
+async def ask_batch():
+    # {"messages": [{"user_id", "question", "location"?, "state_token"?}, ...]} -> {"replies": [...]}, one per message, same order.
+    # Messages are answered in order, so a user's later messages see the state left by earlier ones; in token mode
+    # only a user's first state_token is read and the rest of their messages continue from the updated state.
+    data = request.get_json(silent=True)
+    messages = data.get('messages') if isinstance(data, dict) else None
+    if not isinstance(messages, list):
+        return jsonify({'error': 'Expected {"messages": [...]}'}), 400
+    if len(messages) > ASK_BATCH_MAX_MESSAGES:
+        return jsonify({'error': f'At most {ASK_BATCH_MAX_MESSAGES} messages per batch'}), 413
+
+    bot_logic = get_bot_logic()
+    items, carried_by_user = [], {}
+    for message in messages:
+        message = message if isinstance(message, dict) else {}
+        user_id, user_input = message.get('user_id'), str(message.get('question', '')).strip()
+        location = _parse_location(message.get('location'))
+        if not user_id: error = {'error': 'Missing user_id'}
+        elif message.get('location') and not location: error = {'error': 'Invalid location'}
+        elif not user_input: error = {'text': 'Please type a message.'}
+        else: error = None
+        if error is not None:
+            items.append({'user_id': None, 'data': '', 'reply': (app.json.dumps(error) + "\n").encode('utf-8')})
+            continue
+        user_id = str(user_id)
+        if user_id not in carried_by_user: carried_by_user[user_id] = _carried_session(user_id, message.get('state_token'))
+        items.append({'user_id': user_id, 'data': user_input, 'user_name': 'Visitor', 'location': location, 'session_store': carried_by_user[user_id]})
+
+    def handle(item):
+        if item['user_id'] is None: return item['reply']
+        cache_key, cached = _cached_reply(bot_logic, item['user_id'], item['data'], item['location'], item['session_store'])
+        if cached is not None: return cached.body
+        response_dict = bot_logic.process_user_input(item['user_id'], 'text', item['data'], user_name=item['user_name'],
+                                                     location=item['location'], session_store=item['session_store'])
+        return _finish_reply(bot_logic, item['user_id'], response_dict, item['session_store'], cache_key)[0]
+
+    bodies = await bot_logic.process_batch_async(items, handle=handle)
+    # Every reply is already serialized (cached ones verbatim), so the envelope is assembled from the bytes
+    return Response(b'{"replies":[' + b','.join(body.rstrip(b'\n') for body in bodies) + b']}\n', mimetype='application/json')
+
+@app.route('/parking/ingest', methods=['POST'])
+def parking_ingest():
+    # Gate counters push {"updates": [{"ParkingLotID": .., "CurrentIn": .., "CurrentOut": ..}]} as deltas since their last push
+    token = os.getenv("PARKING_INGEST_TOKEN")
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not token or not hmac.compare_digest(supplied, token):
+        return jsonify({'error': 'Forbidden'}), 403
+    data = request.get_json(silent=True)
+    updates = data.get('updates') if isinstance(data, dict) else data
+    if not isinstance(updates, list):
+        return jsonify({'error': 'Expected a list of updates'}), 400
+    return jsonify(get_bot_logic().apply_parking_deltas(updates))
+
+def _sse(event, payload, event_id=None):
+    lines = [f"event: {event}"] + ([f"id: {event_id}"] if event_id else []) + [f"data: {json.dumps(payload, ensure_ascii=False, separators=(',', ':'))}"]
+    return "\n".join(lines) + "\n\n"
+
+@app.route('/parking/live')
+def parking_live():
+    # Conditional polling: the page revalidates with If-None-Match, so an unchanged feed costs a bodiless 304
+    bot_logic = get_bot_logic()
+    bot_logic.fetch_parking_lots_info()
+    bot_logic.fetch_parking_live_status()  # No-op while fresh; a single-flight refresh once past its TTL
+    body = (app.json.dumps(bot_logic.parking_availability_feed(request.args.get('lang', 'en'))) + "\n").encode('utf-8')
+    return _json_reply(body, body_etag(body))
+
+def _release_parking_stream_slot():
+    with _parking_stream_lock:
+        _parking_stream_slots[0] -= 1
+
+@app.route('/parking/stream')
+def parking_stream():
+    # A full "snapshot" event, then a "diff" with only the lots whose numbers changed on each live-status version bump
+    lang = request.args.get('lang', 'en')
+    with _parking_stream_lock:
+        admitted = _parking_stream_slots[0] < PARKING_STREAM_MAX_SUBSCRIBERS
+        if admitted: _parking_stream_slots[0] += 1
+    if not admitted:
+        # EventSource doesn't retry a non-200 response, so the page falls back to polling right away
+        response = jsonify({'error': 'Too many live parking streams', 'poll': url_for('parking_live', lang=lang)})
+        response.status_code, response.headers['Retry-After'] = 503, str(PARKING_LIVE_POLL_SECONDS)
+        return response
+    bot_logic = get_bot_logic()
+
+    def events():
+        deadline = time.monotonic() + PARKING_STREAM_MAX_SECONDS
+        feed = bot_logic.parking_availability_feed(lang)
+        yield "retry: 5000\n" + _sse("snapshot", feed, "-".join(map(str, feed["versions"])))
+        while time.monotonic() < deadline:
+            versions = bot_logic.wait_for_parking_change(tuple(feed["versions"]), min(PARKING_STREAM_KEEPALIVE_SECONDS, max(0, deadline - time.monotonic())))
+            if list(versions) == feed["versions"]:
+                # Quiet interval: refresh inline if the data is past its TTL (no background thread is assumed)
+                bot_logic.fetch_parking_live_status()
+                if list(bot_logic.parking_versions()) == feed["versions"]:
+                    yield ": keepalive\n\n"
+                    continue
+            previous, feed = feed, bot_logic.parking_availability_feed(lang)
+            event_id = "-".join(map(str, feed["versions"]))
+            if feed["versions"][0] != previous["versions"][0]:  # The lots sheet itself changed; resend everything
+                yield _sse("snapshot", feed, event_id)
+                continue
+            changed = {lot_id: lot for lot_id, lot in feed["lots"].items() if previous["lots"].get(lot_id) != lot}
+            if changed: yield _sse("diff", {"versions": feed["versions"], "lots": changed}, event_id)
+
+    response = Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(_release_parking_stream_slot)  # Also runs when the client goes away before the first event
+    return response
+
+@app.route('/metrics')
+def metrics():
+    return Response(get_bot_logic().metrics.render(), content_type=PROMETHEUS_CONTENT_TYPE)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,66 @@
+# assets.py
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+ASSET_BUILD_DIR = os.path.join(STATIC_DIR, "assets", "build")
+ASSET_MANIFEST_PATH = os.path.join(ASSET_BUILD_DIR, "manifest.json")
+# Chat bubbles are ~300 CSS px wide, so 960 px covers 3x screens; wider variants are never sent to the chat
+ASSET_DISPLAY_WIDTH = int(os.getenv("ASSET_DISPLAY_WIDTH", "960"))
+# Order of the <picture> sources, most compact first; the browser takes the first type it can decode
+FORMAT_PREFERENCE = ("image/avif", "image/webp")
+
+
+class AssetManifest:
+    """Variants written by build_assets.py, keyed by the source path relative to static/.
+
+    Each entry looks like ``{"hash": <source content hash>, "type": <source media type>,
+    "variants": [{"file": .., "type": .., "width": .., "bytes": ..}, ...]}``. Variant files are named by
+    content hash and served from static/ as they are, so they can be cached as immutable.
+    """
+
+    def __init__(self, entries: Optional[Dict[str, Dict]] = None, build_dir: str = ASSET_BUILD_DIR):
+        self.entries, self.build_dir = entries or {}, build_dir
+
+    @classmethod
+    def load(cls, path: str = ASSET_MANIFEST_PATH) -> "AssetManifest":
+        if not os.path.exists(path):
+            logger.info(f"No asset manifest at {path}; images are served as-is. Run build_assets.py to generate variants.")
+            return cls(build_dir=os.path.dirname(path))
+        try:
+            with open(path, encoding="utf-8") as f:
+                return cls(json.load(f).get("assets", {}), build_dir=os.path.dirname(path))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable asset manifest {path}: {e}")
+            return cls(build_dir=os.path.dirname(path))
+
+    def _static_path(self, variant: Dict) -> str:
+        return os.path.relpath(os.path.join(self.build_dir, variant["file"]), STATIC_DIR).replace(os.sep, "/")
+
+    def _fitting(self, entry: Dict, media_type: str, max_width: int) -> List[Dict]:
+        # Variants of one type no wider than max_width (or the narrowest one, if none is), narrowest first
+        candidates = sorted((v for v in entry["variants"] if v["type"] == media_type), key=lambda v: v["width"])
+        return [v for v in candidates if v["width"] <= max_width] or candidates[:1]
+
+    def picture(self, source: str, max_width: int = ASSET_DISPLAY_WIDTH) -> Optional[Dict]:
+        """What a ``<picture>`` element needs for a built image, with paths relative to static/.
+
+        Returns ``{"src": <source-format fallback>, "sources": [{"type": .., "srcset": [[path, width], ...]}, ...]}``
+        with sources in FORMAT_PREFERENCE order, or None when the image has no build.
+        """
+        entry = self.entries.get(source)
+        if not entry: return None
+        fallback = self._fitting(entry, entry["type"], max_width)
+        if not fallback: return None
+        sources = []
+        for media_type in FORMAT_PREFERENCE:
+            variants = self._fitting(entry, media_type, max_width)
+            if variants: sources.append({"type": media_type, "srcset": [[self._static_path(v), v["width"]] for v in variants]})
+        return {"src": self._static_path(fallback[-1]), "sources": sources}
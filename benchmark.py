@@ -0,0 +1,429 @@
+# benchmark.py
+# -*- coding: utf-8 -*-
+#
+# Load-test harness for the /ask conversation flow. Replays scripted sessions against an in-process fake
+# gspread client (configurable latency and 429 injection) and reports latency percentiles, throughput and
+# Sheets calls per request. Examples:
+#
+#   python benchmark.py conversations --sessions 500 --threads 16
+#   python benchmark.py conversations --mode flask --latency 0.2 --error-rate 0.1 --live-ttl 1
+#   python benchmark.py conversations --mode batch --batch-size 50
+#   python benchmark.py conversations --json > bench_output.txt
+#   python benchmark.py startup --trials 5 --latency 0.2
+#   python benchmark.py intents --messages 20000 --typo-share 0.4
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+from queue import Queue, Empty
+
+# Keep the benchmark hermetic: no snapshot reuse between runs and no credentials lookup noise
+os.environ.setdefault("SHEET_SNAPSHOT_PATH", "")
+os.environ.setdefault("SESSION_STORE", "memory")
+
+import bot_logic
+from sheets_guard import SheetsGuard
+from bot_logic import BotLogic, MAIN_MENU_SYNONYMS, PARKING_ROUTE_CHOICES, PARKING_ROUTE_SYNONYMS, LOCAL_INFO_WORKSHEETS, GOOGLE_SHEET_LOCAL_INFO_NAME, GOOGLE_SHEET_PARKING_LOTS_INFO_NAME, GOOGLE_SHEET_PARKING_STATUS_LIVE_NAME
+
+# One pilgrim's walk through every menu: language select -> options 1-11 -> parking routes -> nearby search -> X
+SESSION_SCRIPT = [
+    "start_session_command", "en",
+    "1", "1", "1", "2", "1", "3", "1", "4",
+    "2", "1", "2", "3", "0",
+    "3", "4", "5", "6", "7", "8",
+    "9", "atm",
+    "11",
+    "10", "ta", "3", "1", "2",
+    "X",
+]
+
+
+# --- Fake gspread client ---
+class FakeResponse:
+    def __init__(self, status_code: int, message: str):
+        self.status_code, self.text = status_code, message
+
+    def json(self):
+        return {"error": {"code": self.status_code, "message": self.text, "status": "RESOURCE_EXHAUSTED"}}
+
+
+class FakeSheets:
+    """Holds the fake spreadsheet contents and counts every call that would hit the Sheets/Drive APIs."""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, rows: int = 20, lots: int = 30, seed: int = 7):
+        self.latency, self.error_rate = latency, error_rate
+        self.calls, self.errors_injected = 0, 0
+        self._lock, self._random = threading.Lock(), random.Random(seed)
+        rnd = random.Random(seed)
+        self.data = {
+            GOOGLE_SHEET_LOCAL_INFO_NAME: {ws: [{"Name_en": f"{ws} {i}", "Name_ta": f"{ws} {i} (த)", "Notes_en": "Open 24 hours", "Notes_ta": "24 மணி நேரம்",
+                                                 "RouteInfo_en": "Tirunelveli Road", "ActiveDuring_en": "Festival days", "RouteDirection_en": "North",
+                                                 "OperationDuring_en": "All days", "Timings_en": "12:00-15:00", "ContactInfo_en": "0461-000000"}
+                                                for i in range(rows)] for ws in LOCAL_INFO_WORKSHEETS},
+            GOOGLE_SHEET_PARKING_LOTS_INFO_NAME: {"Sheet1": [{"ParkingLotID": i, "Parking_name_en": f"Lot {i}", "Parking_name_ta": f"நிறுத்தம் {i}",
+                                                              "Latitude": 8.40 + rnd.random() * 0.2, "Longitude": 77.95 + rnd.random() * 0.25,
+                                                              "TotalCapacity": rnd.choice([50, 100, 200, 500]), "Priority": rnd.randint(1, 3),
+                                                              "Route_en": rnd.choice(["Tirunelveli", "Thoothukudi", "Nagercoil", "Tirunelveli, Nagercoil"])}
+                                                             for i in range(lots)]},
+            GOOGLE_SHEET_PARKING_STATUS_LIVE_NAME: {"Sheet1": [{"ParkingLotID": i, "CurrentIn": rnd.randint(0, 300), "CurrentOut": rnd.randint(0, 100), "CurrentAvailability": ""}
+                                                               for i in range(lots)]},
+        }
+
+    def call(self, what: str):
+        with self._lock:
+            self.calls += 1
+            inject = self._random.random() < self.error_rate
+            if inject: self.errors_injected += 1
+        if self.latency: time.sleep(self.latency)
+        if inject:
+            import gspread  # Only when injecting errors, so the startup benchmark's fakes don't pull it in
+            raise gspread.exceptions.APIError(FakeResponse(429, f"Quota exceeded ({what})"))
+
+    def values(self, sheet_name: str, worksheet_name: str):
+        records = self.data[sheet_name][worksheet_name]
+        headers = list(dict.fromkeys(key for record in records for key in record))
+        return [headers] + [[str(record.get(h, "")) for h in headers] for record in records] if records else []
+
+
+class FakeWorksheet:
+    def __init__(self, sheets: FakeSheets, sheet_name: str, title: str):
+        self._sheets, self._sheet_name, self.title = sheets, sheet_name, title
+
+    def get_all_records(self):
+        self._sheets.call("get_all_records")
+        return [dict(r) for r in self._sheets.data[self._sheet_name][self.title]]
+
+
+class FakeSpreadsheet:
+    def __init__(self, sheets: FakeSheets, name: str):
+        self._sheets, self.title, self.id = sheets, name, f"fake-{name}"
+
+    def worksheets(self):
+        self._sheets.call("worksheets")
+        return [FakeWorksheet(self._sheets, self.title, ws) for ws in self._sheets.data[self.title]]
+
+    def worksheet(self, title: str):
+        self._sheets.call("worksheet")
+        return FakeWorksheet(self._sheets, self.title, title)
+
+    def values_batch_get(self, ranges, params=None):
+        self._sheets.call("values_batch_get")
+        # Like the real API, one range naming a missing tab fails the whole request
+        unknown = [r for r in ranges if r.split("!")[0].strip("'") not in self._sheets.data[self.title]]
+        if unknown:
+            import gspread
+            raise gspread.exceptions.APIError(FakeResponse(400, f"Unable to parse range: {unknown[0]}"))
+        return {"valueRanges": [{"range": r, "values": self._sheets.values(self.title, r.split("!")[0].strip("'"))} for r in ranges]}
+
+
+class FakeGspreadClient:
+    def __init__(self, sheets: FakeSheets):
+        self._sheets = sheets
+
+    def open(self, name: str):
+        self._sheets.call("open")
+        return FakeSpreadsheet(self._sheets, name)
+
+    def open_by_key(self, key: str):
+        self._sheets.call("open_by_key")
+        return FakeSpreadsheet(self._sheets, key[len("fake-"):])
+
+
+# --- Harness ---
+def percentile(sorted_values, pct: float) -> float:
+    if not sorted_values: return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def make_sender(mode: str, bot: BotLogic):
+    if mode == "botlogic":
+        return lambda user_id, message, location: bot.process_user_input(user_id, "text", message, user_name="Visitor", location=location)
+
+    import app as app_module
+    app_module._bot_logic = bot
+    local = threading.local()
+
+    if mode == "batch":
+        def send_batch(messages):
+            # messages: [(user_id, message, location)] -> replies in the same order, via one /ask/batch request
+            client = getattr(local, "client", None)
+            if client is None: client = local.client = app_module.app.test_client()
+            payload = [{"question": message, "user_id": user_id, **({"location": {"lat": location[0], "lon": location[1]}} if location else {})}
+                       for user_id, message, location in messages]
+            response = client.post("/ask/batch", json={"messages": payload})
+            if response.status_code != 200: raise RuntimeError(f"/ask/batch returned {response.status_code}")
+            return response.get_json()["replies"]
+        return send_batch
+
+    def send(user_id, message, location):
+        client = getattr(local, "client", None)
+        if client is None: client = local.client = app_module.app.test_client()
+        payload = {"question": message, "user_id": user_id}
+        if location: payload["location"] = {"lat": location[0], "lon": location[1]}
+        response = client.post("/ask", json=payload)
+        if response.status_code != 200: raise RuntimeError(f"/ask returned {response.status_code}")
+        return response.get_json()
+    return send
+
+
+def run_conversations(args) -> dict:
+    sheets = FakeSheets(latency=args.latency, error_rate=args.error_rate, rows=args.rows, lots=args.lots, seed=args.seed)
+    guard = None if args.quota_per_minute is None else SheetsGuard(rate_per_minute=args.quota_per_minute, burst=max(1, args.quota_per_minute / 6))
+    bot = BotLogic(gspread_client=FakeGspreadClient(sheets), snapshot_path="", sheets_guard=guard)
+    if args.live_ttl is not None: bot.LIVE_DATA_CACHE_DURATION = args.live_ttl
+    if args.local_ttl is not None: bot.LOCAL_INFO_CACHE_DURATION = args.local_ttl
+    if args.background_refresh: bot.start_background_refresh(tick_seconds=0.5)
+    send = make_sender(args.mode, bot)
+
+    sessions = Queue()
+    for i in range(args.sessions): sessions.put(i)
+    latencies, failures, lock = [], [0], threading.Lock()
+    calls_before = sheets.calls
+
+    def batch_worker(worker_id: int):
+        # A gateway's view: up to --batch-size sessions advance one script step per /ask/batch request;
+        # every message in a request is charged that request's latency
+        rnd, own = random.Random(args.seed * 1000 + worker_id), []
+        while True:
+            group = []
+            while len(group) < args.batch_size:
+                try: group.append(sessions.get_nowait())
+                except Empty: break
+            if not group: break
+            users = [(f"bench-{session}", (8.40 + rnd.random() * 0.2, 77.95 + rnd.random() * 0.25) if rnd.random() < args.location_share else None) for session in group]
+            for message in SESSION_SCRIPT:
+                start = time.perf_counter()
+                try:
+                    replies = send([(user_id, message, location) for user_id, location in users])
+                    empty = sum(1 for reply in replies if not reply.get("text"))
+                except Exception as e:
+                    empty = len(users)
+                    if args.verbose: print(f"batch {message!r} failed: {e}", file=sys.stderr)
+                if empty:
+                    with lock: failures[0] += empty
+                own.extend([time.perf_counter() - start] * len(users))
+        with lock: latencies.extend(own)
+
+    def worker(worker_id: int):
+        rnd, own = random.Random(args.seed * 1000 + worker_id), []
+        while True:
+            try: session = sessions.get_nowait()
+            except Empty: break
+            user_id = f"bench-{session}"
+            location = (8.40 + rnd.random() * 0.2, 77.95 + rnd.random() * 0.25) if rnd.random() < args.location_share else None
+            for message in SESSION_SCRIPT:
+                start = time.perf_counter()
+                try:
+                    response = send(user_id, message, location)
+                    if not response.get("text"): raise RuntimeError(f"Empty reply to {message!r}")
+                except Exception as e:
+                    with lock: failures[0] += 1
+                    if args.verbose: print(f"[{user_id}] {message!r} failed: {e}", file=sys.stderr)
+                own.append(time.perf_counter() - start)
+        with lock: latencies.extend(own)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=batch_worker if args.mode == "batch" else worker, args=(i,), name=f"bench-{i}") for i in range(args.threads)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - started
+    if args.background_refresh: bot.stop_background_refresh(timeout=5)
+
+    latencies.sort()
+    requests = len(latencies)
+    sheet_calls = sheets.calls - calls_before
+    return {
+        "mode": args.mode, "threads": args.threads, "sessions": args.sessions, "requests": requests, "failures": failures[0],
+        "elapsed_s": round(elapsed, 3), "throughput_rps": round(requests / elapsed, 1) if elapsed else 0.0,
+        "conversations_per_s": round(args.sessions / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3), "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3), "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        "sheet_calls": sheet_calls, "sheet_calls_per_request": round(sheet_calls / requests, 4) if requests else 0.0,
+        "injected_429s": sheets.errors_injected,
+        "throttled_fetches": sum(v for (name, _), v in bot.metrics._counters.items() if name == "tirubot_sheets_throttled_total"),
+    }
+
+
+# Runs in a fresh interpreter per trial, so module imports are measured cold. Prints one JSON line.
+STARTUP_CHILD = r"""
+import json, sys, time
+started = time.perf_counter()
+import bot_logic
+bot_logic_imported = time.perf_counter()
+import app
+app_imported = time.perf_counter()
+options = json.loads(sys.argv[1])
+import benchmark  # Fakes only; bot_logic and app are already loaded
+sheets = benchmark.FakeSheets(latency=options["latency"])
+app.BotLogic = lambda: bot_logic.BotLogic(gspread_client=benchmark.FakeGspreadClient(sheets), snapshot_path=options["snapshot_path"])
+client = app.app.test_client()
+page = client.get("/")
+first_page = time.perf_counter()
+reply = client.post("/ask", json={"question": "1", "user_id": "startup-bench"})
+first_reply = time.perf_counter()
+assert page.status_code == 200 and reply.status_code == 200
+print(json.dumps({"import_bot_logic_ms": (bot_logic_imported - started) * 1000, "import_app_ms": (app_imported - bot_logic_imported) * 1000,
+                  "first_page_ms": (first_page - app_imported) * 1000, "first_reply_ms": (first_reply - first_page) * 1000,
+                  "import_to_first_page_ms": (first_page - started) * 1000, "sheet_calls": sheets.calls}))
+"""
+
+
+def run_startup(args) -> dict:
+    env = {**os.environ, "SESSION_STORE": "memory", "BOT_WARMUP": "lazy", "BOT_BACKGROUND_REFRESH": ""}
+    snapshot_dir = tempfile.mkdtemp(prefix="tirubot-startup-")
+    snapshot_path = os.path.join(snapshot_dir, "snapshot.json") if args.snapshot else ""
+    options = json.dumps({"latency": args.latency, "snapshot_path": snapshot_path})
+    samples = []
+    # With --snapshot the first run writes the snapshot and later runs start from it, as a warm lambda container would
+    for trial in range(args.trials + (1 if args.snapshot else 0)):
+        started = time.perf_counter()
+        child = subprocess.run([sys.executable, "-c", STARTUP_CHILD, options], cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True)
+        wall_ms = (time.perf_counter() - started) * 1000
+        if child.returncode != 0:
+            raise RuntimeError(f"Startup trial failed:\n{child.stderr[-2000:]}")
+        if args.snapshot and trial == 0: continue
+        samples.append({**json.loads(child.stdout.strip().splitlines()[-1]), "process_wall_ms": wall_ms})
+    report = {"trials": len(samples), "latency_s": args.latency, "snapshot": args.snapshot}
+    for key in samples[0]:
+        values = [sample[key] for sample in samples]
+        report[f"{key}_median" if key != "sheet_calls" else key] = round(statistics.median(values), 3)
+    return report
+
+
+def make_typo(rnd: random.Random, phrase: str) -> str:
+    # One deletion, transposition or substitution inside the phrase's longest word
+    words = phrase.split()
+    i = max(range(len(words)), key=lambda k: len(words[k]))
+    word = words[i]
+    if len(word) < 4: return phrase
+    pos, kind = rnd.randrange(1, len(word) - 1), rnd.choice(("delete", "swap", "replace"))
+    if kind == "delete": word = word[:pos] + word[pos + 1:]
+    elif kind == "swap": word = word[:pos] + word[pos + 1] + word[pos] + word[pos + 2:]
+    else: word = word[:pos] + rnd.choice("aeiou") + word[pos + 1:]
+    return " ".join(words[:i] + [word] + words[i + 1:])
+
+
+def make_intent_corpus(rnd: random.Random, size: int, typo_share: float, noise_share: float, number_share: float):
+    # (menu level, message, expected intent or None) drawn from option numbers, synonyms, typos of synonyms and noise
+    menus = {"main_menu": MAIN_MENU_SYNONYMS, "parking_awaiting_route": PARKING_ROUTE_SYNONYMS}
+    numbers = {"main_menu": {choice: choice for choice in MAIN_MENU_SYNONYMS}, "parking_awaiting_route": {route: choice for choice, route in PARKING_ROUTE_CHOICES.items()}}
+    fillers = ("", "where is ", "show me ", "need ", "")
+    corpus = []
+    for _ in range(size):
+        menu_level = "main_menu" if rnd.random() < 0.75 else "parking_awaiting_route"
+        if rnd.random() < noise_share:
+            corpus.append((menu_level, "".join(rnd.choice("bcdfghjklmnpqrstvwxz") for _ in range(rnd.randint(3, 8))), None))
+            continue
+        intent, phrases = rnd.choice(list(menus[menu_level].items()))
+        if rnd.random() < number_share:
+            corpus.append((menu_level, numbers[menu_level][intent], intent))
+            continue
+        phrase = rnd.choice(phrases)
+        if rnd.random() < typo_share: phrase = make_typo(rnd, phrase)
+        corpus.append((menu_level, rnd.choice(fillers) + phrase, intent))
+    return corpus
+
+
+def run_intents(args) -> dict:
+    sheets = FakeSheets(latency=0.0, rows=args.rows)
+    bot = BotLogic(gspread_client=FakeGspreadClient(sheets), snapshot_path="")
+    corpus = make_intent_corpus(random.Random(args.seed), args.messages, args.typo_share, args.noise_share, args.number_share)
+    matchers = {"main_menu": bot._main_menu_matcher(), "parking_awaiting_route": bot._parking_route_matcher}
+    report = {"messages": len(corpus), "vocabulary_main_menu": len(matchers["main_menu"]), "vocabulary_routes": len(matchers["parking_awaiting_route"])}
+    # Cold: memoization off, every message tokenized and scored; warm: repeated messages come from the memo
+    for label, memo_size in (("cold", 0), ("warm", 4096)):
+        for matcher in matchers.values(): matcher.memo_size = memo_size
+        latencies, results = [], []
+        started = time.perf_counter()
+        for menu_level, message, _ in corpus:
+            t0 = time.perf_counter()
+            results.append(bot._match_intent(menu_level, message))
+            latencies.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        report[f"{label}_messages_per_s"] = round(len(corpus) / elapsed) if elapsed else 0
+        report[f"{label}_p50_us"] = round(percentile(latencies, 50) * 1e6, 2)
+        report[f"{label}_p99_us"] = round(percentile(latencies, 99) * 1e6, 2)
+    labelled = [(expected, result) for (_, _, expected), result in zip(corpus, results) if expected is not None]
+    noise = [result for (_, _, expected), result in zip(corpus, results) if expected is None]
+    # Before the matcher only an exact option number was understood; every other message cost an invalid-option round trip
+    exact_numbers = sum(1 for _, message, _ in corpus if message.isdigit())
+    report["resolved_share"] = round(sum(1 for _, r in labelled if r is not None) / len(labelled), 4) if labelled else 0.0
+    report["accuracy"] = round(sum(1 for e, r in labelled if r is not None and r.intent == e) / len(labelled), 4) if labelled else 0.0
+    report["noise_false_matches"] = sum(1 for r in noise if r is not None)
+    report["round_trips_saved_per_100_msgs"] = round(100 * (sum(1 for _, r in labelled if r is not None) - exact_numbers) / len(corpus), 1)
+    return report
+
+
+def print_report(title: str, report: dict, as_json: bool):
+    if as_json:
+        print(json.dumps(report))
+        return
+    print(f"--- {title} ---")
+    for key, value in report.items():
+        print(f"{key:>32}: {value}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the Tiruchendur assistant.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    conv = sub.add_parser("conversations", help="Replay scripted /ask sessions and report latency, throughput and Sheets calls.")
+    conv.add_argument("--mode", choices=["botlogic", "flask", "batch"], default="botlogic",
+                      help="Call BotLogic directly, go through the Flask test client, or send each step of --batch-size sessions to /ask/batch at once.")
+    conv.add_argument("--batch-size", type=int, default=25, help="Sessions per /ask/batch request in batch mode.")
+    conv.add_argument("--sessions", type=int, default=200)
+    conv.add_argument("--threads", type=int, default=8)
+    conv.add_argument("--latency", type=float, default=0.05, help="Seconds of simulated latency per Sheets call.")
+    conv.add_argument("--error-rate", type=float, default=0.0, help="Fraction of Sheets calls that fail with HTTP 429.")
+    conv.add_argument("--rows", type=int, default=20, help="Rows per local-info worksheet.")
+    conv.add_argument("--lots", type=int, default=30, help="Number of parking lots.")
+    conv.add_argument("--live-ttl", type=float, default=None, help="Override LIVE_DATA_CACHE_DURATION (s) to exercise refreshes.")
+    conv.add_argument("--local-ttl", type=float, default=None, help="Override LOCAL_INFO_CACHE_DURATION (s).")
+    conv.add_argument("--quota-per-minute", type=float, default=None, help="Override the Sheets rate limit (requests/minute).")
+    conv.add_argument("--location-share", type=float, default=0.5, help="Fraction of sessions that send a user location.")
+    conv.add_argument("--background-refresh", action="store_true", help="Run BotLogic's background refresher during the test.")
+    conv.add_argument("--seed", type=int, default=7)
+    conv.add_argument("--json", action="store_true", help="Print one JSON line instead of a table.")
+    conv.add_argument("--verbose", action="store_true")
+
+    startup = sub.add_parser("startup", help="Measure cold import time and time to the first page and reply, one fresh interpreter per trial.")
+    startup.add_argument("--trials", type=int, default=5)
+    startup.add_argument("--latency", type=float, default=0.05, help="Seconds of simulated latency per Sheets call during preload.")
+    startup.add_argument("--snapshot", action="store_true", help="Start from an on-disk sheet snapshot written by a priming run.")
+    startup.add_argument("--json", action="store_true", help="Print one JSON line instead of a table.")
+    startup.add_argument("--verbose", action="store_true")
+
+    intents = sub.add_parser("intents", help="Measure free-text intent matching throughput and accuracy on synonyms, typos and noise.")
+    intents.add_argument("--messages", type=int, default=20000)
+    intents.add_argument("--typo-share", type=float, default=0.4, help="Fraction of messages with one typo injected.")
+    intents.add_argument("--number-share", type=float, default=0.3, help="Fraction of messages that are just the option number.")
+    intents.add_argument("--noise-share", type=float, default=0.1, help="Fraction of messages that are random letters and should not match.")
+    intents.add_argument("--rows", type=int, default=20, help="Rows per local-info worksheet (their item names join the vocabulary).")
+    intents.add_argument("--seed", type=int, default=7)
+    intents.add_argument("--json", action="store_true", help="Print one JSON line instead of a table.")
+    intents.add_argument("--verbose", action="store_true")
+
+    args = parser.parse_args(argv)
+    for logger_name in (bot_logic.__name__, "sheets_guard"):
+        logging.getLogger(logger_name).setLevel(logging.ERROR if args.verbose else logging.CRITICAL)
+    if args.command == "conversations":
+        print_report("Conversation benchmark", run_conversations(args), args.json)
+    elif args.command == "startup":
+        print_report("Startup benchmark", run_startup(args), args.json)
+    elif args.command == "intents":
+        print_report("Intent matching benchmark", run_intents(args), args.json)
+
+
+if __name__ == "__main__":
+    main()
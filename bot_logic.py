@@ -5,15 +5,23 @@ import os
 import logging
 import time
 import json 
-from typing import List, Dict, Any, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import List, Dict, Any, Callable, Optional, Tuple
 from dotenv import load_dotenv
-import gspread
-from google.oauth2.service_account import Credentials
-from math import radians, sin, cos, sqrt, atan2
-from collections import defaultdict
+from collections import defaultdict, deque, OrderedDict
+from itertools import count
 from urllib.parse import quote_plus
+from string import Formatter
+from types import MappingProxyType
+from session_store import SessionStore, create_session_store_from_env
+from parking_index import ParkingLotIndex, haversine_km, to_int
+from metrics import Metrics
+from sheets_guard import SheetsGuard, SheetsUnavailable, api_status, create_sheets_guard_from_env
+from intent_matcher import IntentMatch, IntentMatcher
 
-load_dotenv()
+load_dotenv()  # Before the configuration below is read; gspread and google-auth are only imported on first fetch
 
 # --- Define the base directory (for local file fallback) ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -25,12 +33,22 @@ GOOGLE_SHEET_PARKING_LOTS_INFO_NAME = os.getenv("GOOGLE_SHEET_PARKING_LOTS_INFO"
 GOOGLE_SHEET_PARKING_STATUS_LIVE_NAME = os.getenv("GOOGLE_SHEET_PARKING_STATUS_LIVE", "Tiruchendur_Parking_Status_Live")
 credentials_filename = os.getenv("GOOGLE_SHEETS_CREDENTIALS_FILE", "credentials.json")
 GOOGLE_SHEETS_CREDENTIALS_FILE = os.path.join(BASE_DIR, credentials_filename)
+# Local snapshot of all sheet data; /tmp is the only writable location on Vercel. Set to "" to disable.
+SHEET_SNAPSHOT_PATH = os.getenv("SHEET_SNAPSHOT_PATH", "/tmp/tirubot_sheet_snapshot.json")
+SHEET_SNAPSHOT_FORMAT_VERSION = 1
+# Async serving path: sheet I/O runs on a bounded pool and a request waits at most this long for it
+SHEET_IO_WORKERS = int(os.getenv("SHEET_IO_WORKERS", "4"))
+SHEET_FETCH_TIMEOUT_SECONDS = float(os.getenv("SHEET_FETCH_TIMEOUT_SECONDS", "3"))
+# False while a request is served from the async path, so handlers never block the event loop on Sheets
+_INLINE_SHEET_FETCH = ContextVar("inline_sheet_fetch", default=True)
+# Optional spreadsheet IDs; when set, spreadsheets are opened by key instead of a Drive search by name
+SPREADSHEET_IDS = {name: key for name, key in (
+    (GOOGLE_SHEET_LOCAL_INFO_NAME, os.getenv("GOOGLE_SHEET_LOCAL_INFO_ID")),
+    (GOOGLE_SHEET_PARKING_LOTS_INFO_NAME, os.getenv("GOOGLE_SHEET_PARKING_LOTS_INFO_ID")),
+    (GOOGLE_SHEET_PARKING_STATUS_LIVE_NAME, os.getenv("GOOGLE_SHEET_PARKING_STATUS_LIVE_ID")),
+) if key}
 
-# Centralized logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(module)s:%(lineno)d - %(message)s',
-    level=logging.INFO
-)
+# Logging is configured by the entry point (app.py); importing this module has no global side effects
 logger = logging.getLogger(__name__)
 
 # --- All Constants and Menu Texts ---
@@ -126,13 +144,97 @@ MENU_TEXTS = {
         "overall_parking_map_link_text": "\n\n<a href=\"{overall_map_url}\" data-embed=\"true\">🗺️ {RouteName} வழிக்கான அனைத்து வாகன நிறுத்துமிடங்களையும் காண்க</a>",
         "temple_timings_details": "திருச்செந்தூர் முருகன் கோவில் பொது நேரங்கள்:",
         "temple_dress_code_details": "ஆடை கட்டுப்பாடு: பாரம்பரிய உடை பரிந்துரைக்கப்படுகிறது. ஆண்கள்: வேட்டி/பேண்ட். பெண்கள்: புடவை/சல்வார் கமீஸ்.",
+        "temple_seva_details_intro": "--- சேவை & டிக்கெட் விவரங்கள் (கட்டணங்கள் மாறுதலுக்கு உட்பட்டவை) ---",
         "goodbye_message": "நன்றி! வணக்கம்!",
         "nearest_place_intro": "📍 திருச்செந்தூர் பகுதியில் {place_type_display_name} தேடல் முடிவுகள்:",
         "place_details_maps": "\n{name}\nமுகவரி: {address}\n🗺️ {maps_url}"
     }
 }
 SUPPORTED_LANGUAGES = { "en": {"name": "English"}, "ta": {"name": "தமிழ் (Tamil)"} }
+MENU_KEYS = {
+    "main_menu": ("main_menu_prompt", "option_parking_availability", "option_temple_info", "option_help_centres", "option_first_aid", "option_temp_bus_stands", "option_toilets_temple", "option_annadhanam", "option_emergency_contacts", "option_nearby_facilities", "option_change_language", "option_feedback", "option_end_conversation_text"),
+    "temple_info_menu": ("temple_info_menu_prompt", "temple_timings_menu_item", "temple_dress_code_menu_item", "temple_seva_tickets_menu_item", "option_go_back_text"),
+}
+
+def _compile_menu_texts():
+    # Validate MENU_TEXTS once at import and build immutable per-language tables, so requests never pay for
+    # fallback resolution, placeholder checks or menu assembly.
+    english = MENU_TEXTS["en"]
+    template_fields = {key: frozenset(f for _, f, _, _ in Formatter().parse(text) if f) for key, text in english.items()}
+    texts, menus = {}, {}
+    for lang in SUPPORTED_LANGUAGES:
+        lang_texts = MENU_TEXTS.get(lang, {})
+        missing = [key for key in english if key not in lang_texts]
+        if missing: logger.warning(f"MENU_TEXTS['{lang}'] is missing {missing}; English text will be used.")
+        for key, text in lang_texts.items():
+            fields = frozenset(f for _, f, _, _ in Formatter().parse(text) if f)
+            if key in template_fields and fields != template_fields[key]:
+                logger.warning(f"MENU_TEXTS['{lang}']['{key}'] placeholders {sorted(fields)} differ from English {sorted(template_fields[key])}.")
+        texts[lang] = MappingProxyType({**english, **lang_texts})
+        menus[lang] = MappingProxyType({menu: "\n".join(texts[lang][k] for k in keys) for menu, keys in MENU_KEYS.items()})
+    return MappingProxyType(texts), MappingProxyType(menus), MappingProxyType(template_fields)
+
+COMPILED_MENU_TEXTS, COMPILED_MENUS, TEMPLATE_FIELDS = _compile_menu_texts()
 SHEET_HELP_CENTRES, SHEET_FIRST_AID, SHEET_TEMP_BUS_STANDS, SHEET_TOILETS, SHEET_DESIGNATED_PARKING_STATIC, SHEET_ANNADHANAM = "Help_Centres", "First_Aid_Stations", "Temp_Bus_Stands", "Toilets_Near_Temple", "Designated_Public_Parking", "Annadhanam_Details"
+LOCAL_INFO_WORKSHEETS = (SHEET_HELP_CENTRES, SHEET_FIRST_AID, SHEET_TEMP_BUS_STANDS, SHEET_TOILETS, SHEET_DESIGNATED_PARKING_STATIC, SHEET_ANNADHANAM)
+
+# Words pilgrims type instead of the option number, on top of the menu labels themselves (matched with typos)
+MAIN_MENU_SYNONYMS = {
+    "1": ("parking", "car parking", "bike parking", "vehicle", "park", "வாகனம்", "பார்க்கிங்", "நிறுத்தம்"),
+    "2": ("temple", "murugan", "timings", "darshan", "nadai", "pooja", "dress code", "seva", "ticket", "கோவில்", "தரிசனம்", "பூஜை", "நடை"),
+    "3": ("help", "help desk", "help centre", "enquiry", "lost", "உதவி", "மையம்"),
+    "4": ("first aid", "medical", "doctor", "hospital", "injury", "முதலுதவி", "மருத்துவம்", "மருத்துவமனை"),
+    "5": ("bus", "bus stand", "bus stop", "பேருந்து", "பஸ்"),
+    "6": ("toilet", "restroom", "washroom", "bathroom", "கழிப்பறை", "கழிவறை"),
+    "7": ("annadhanam", "annadanam", "food", "meals", "lunch", "prasadam", "அன்னதானம்", "உணவு", "சாப்பாடு"),
+    "8": ("emergency", "police", "ambulance", "fire", "helpline", "அவசரம்", "காவல்", "ஆம்புலன்ஸ்"),
+    "9": ("nearby", "atm", "hotel", "restaurant", "lodge", "search", "ஏடிஎம்", "ஹோட்டல்"),
+    "10": ("language", "change language", "tamil", "english", "மொழி", "தமிழ்", "ஆங்கிலம்"),
+    "11": ("feedback", "suggestion", "complaint", "review", "கருத்து", "பின்னூட்டம்"),
+}
+# parking_route_prompt option number -> route preference passed to find_*_parking
+PARKING_ROUTE_CHOICES = {"1": "tirunelveli", "2": "thoothukudi", "3": "nagercoil", "4": "any"}
+PARKING_ROUTE_SYNONYMS = {
+    "tirunelveli": ("tirunelveli", "nellai", "tvl", "palayamkottai", "திருநெல்வேலி", "நெல்லை", "பாளையங்கோட்டை"),
+    "thoothukudi": ("thoothukudi", "tuticorin", "tuty", "தூத்துக்குடி"),
+    "nagercoil": ("nagercoil", "kanyakumari", "kanniyakumari", "நாகர்கோவில்", "கன்னியாகுமரி"),
+    "any": ("other", "already here", "local", "tiruchendur", "மற்றவை", "திருச்செந்தூர்"),
+}
+
+
+def _numbered_labels(text: str) -> List[Tuple[str, str]]:
+    # "1. Tirunelveli Route" -> ("1", "Tirunelveli Route"), for every numbered line of a menu text
+    lines = (line.strip().split(". ", 1) for line in text.splitlines())
+    return [(parts[0], parts[1]) for parts in lines if len(parts) == 2 and parts[0].isdigit()]
+
+
+def build_main_menu_matcher(local_info: Optional[Dict[str, List[Dict]]] = None) -> IntentMatcher:
+    # Intents are the main-menu option numbers. Local-info item names (e.g. a help centre's street) add
+    # low-weight words pointing at the option that lists them; they never claim a whole message.
+    matcher = IntentMatcher()
+    for texts in COMPILED_MENU_TEXTS.values():
+        for key in MENU_KEYS["main_menu"]:
+            for choice, label in _numbered_labels(texts[key]): matcher.add(choice, label)
+    for choice, phrases in MAIN_MENU_SYNONYMS.items():
+        matcher.add(choice, choice, weight=0.5)  # "toilets 5" still means toilets
+        matcher.add_all(choice, phrases)
+    sheet_choices = {**{ws: choice for choice, ws in BotLogic._LOCAL_INFO_CHOICES.items()}, SHEET_DESIGNATED_PARKING_STATIC: "1"}
+    for worksheet_name, records in (local_info or {}).items():
+        if worksheet_name not in sheet_choices: continue
+        for record in records:
+            for lang in SUPPORTED_LANGUAGES:
+                name = record.get(f"Name_{lang}")
+                if name: matcher.add(sheet_choices[worksheet_name], str(name), weight=0.5, exact=False)
+    return matcher
+
+
+def build_parking_route_matcher() -> IntentMatcher:
+    matcher = IntentMatcher()
+    for texts in COMPILED_MENU_TEXTS.values():
+        for choice, label in _numbered_labels(texts["parking_route_prompt"]): matcher.add(PARKING_ROUTE_CHOICES[choice], label)
+    for choice, route in PARKING_ROUTE_CHOICES.items(): matcher.add(route, choice, weight=0.5)  # "Tirunelveli 2" is Tirunelveli
+    for route, phrases in PARKING_ROUTE_SYNONYMS.items(): matcher.add_all(route, phrases)
+    return matcher
 
 OVERALL_ROUTE_MY_MAPS = {
     "thoothukudi": "1RTKvzXANpeJXI5wsW28WGclXkO2T7kw",
@@ -141,19 +243,71 @@ OVERALL_ROUTE_MY_MAPS = {
 }
 
 class BotLogic:
-    def __init__(self):
+    def __init__(self, gspread_client=None, clock=time.time, preload: bool = True, session_store: Optional[SessionStore] = None, snapshot_path: Optional[str] = SHEET_SNAPSHOT_PATH,
+                 sheets_guard: Optional[SheetsGuard] = None):
         logger.info("Initializing BotLogic...")
-        self.user_states = {}
+        self._clock = clock
+        self.metrics = Metrics()
+        self.metrics.register_gauge("tirubot_dataset_age_seconds", self._collect_dataset_ages)
+        self.metrics.register_gauge("tirubot_sessions", lambda: {(): len(self.user_states)})
+        self.user_states = session_store if session_store is not None else create_session_store_from_env()
         self.TIRUCHENDUR_COORDS = (8.4967, 78.1245)
         self.LOCAL_INFO_CACHE, self.LAST_LOCAL_INFO_FETCH_TIME = {}, {}
+        # Bumped whenever a worksheet's records are replaced; keys the rendered-reply cache
+        self.LOCAL_INFO_VERSION, self._data_versions = {}, count(1)
+        self._local_info_render_cache = {}  # (worksheet, lang) -> (version, rendered text)
         self.PARKING_LOTS_INFO_CACHE, self.LAST_PARKING_LOTS_INFO_FETCH_TIME = [], 0
         self.PARKING_LIVE_STATUS_CACHE, self.LAST_PARKING_LIVE_STATUS_FETCH_TIME = {}, 0
+        # Lot geometry is parsed once per lots refresh; availability once per (lots, live status) version pair
+        self.PARKING_LOTS_VERSION, self.PARKING_LIVE_VERSION = 0, 0
+        self._parking_index, self._parking_availability = ParkingLotIndex([]), None
+        # Gate counters push per-lot deltas (apply_parking_deltas); while they do, the live sheet is only re-read to reconcile
+        self.LAST_PARKING_DELTA_TIME, self.PARKING_RECONCILE_INTERVAL = 0, 900
+        self._parking_live_write_lock = threading.Lock()
+        # (applied_at, lot_id, entered, exited) for every applied delta, replayed over a re-read sheet so a reconcile
+        # never drops gate traffic the sheet hasn't seen yet; pruned on each reconcile
+        self._parking_delta_log = deque(maxlen=100_000)
+        # Signalled on every lots/live version bump so /parking/stream subscribers wake without polling
+        self._parking_changed, self._parking_feed_cache = threading.Condition(), {}
+        # Free-text menu input: the main-menu matcher follows the local-info sheets (item names), the route matcher is fixed
+        self._main_menu_matcher_cache, self._parking_route_matcher = None, build_parking_route_matcher()
+        # Replies for user-location queries, shared by everyone in the same ~1 km cell: (route, lang, cell, versions) -> text
+        self.PARKING_LOCATION_CELL_DEGREES, self.PARKING_LOCATION_CACHE_SIZE = 0.01, 4096
+        self._parking_location_cache, self._parking_location_cache_lock = OrderedDict(), threading.Lock()
         self.LIVE_DATA_CACHE_DURATION, self.LOCAL_INFO_CACHE_DURATION, self.STATIC_DATA_CACHE_DURATION = 120, 600, 1800
         self.PARKING_FULL_THRESHOLD_PERCENT = 70.0
-        self.gspread_client = None
-        self._preload_data()
+        self.gspread_client = gspread_client
+        # Every Sheets request spends from one rate-limited budget; a failing spreadsheet trips its own circuit
+        self.sheets_guard = sheets_guard if sheets_guard is not None else create_sheets_guard_from_env()
+        if self.sheets_guard.on_error is None:  # Count every failed attempt, including the ones retried away
+            self.sheets_guard.on_error = lambda sheet_name, status: self.metrics.inc("tirubot_sheets_api_errors_total", status=status)
+        self.metrics.register_gauge("tirubot_sheets_quota_remaining", lambda: {(): self.sheets_guard.remaining_budget()})
+        self.metrics.register_gauge("tirubot_sheets_circuit_open", lambda: {(("spreadsheet", k),): int(v != "closed") for k, v in self.sheets_guard.circuit_states().items()})
+        self._client_lock, self._client_generation = threading.Lock(), 0
+        # Striped per-user locks: a user's read-modify-write of their session never interleaves with itself
+        self._user_locks = tuple(threading.Lock() for _ in range(64))
+        self._background_lock = threading.Lock()
+        self._io_executor, self._io_executor_lock = None, threading.Lock()
+        # One lock per dataset so concurrent requests coalesce into a single in-flight fetch
+        self._parking_lots_refresh_lock, self._parking_live_refresh_lock = threading.Lock(), threading.Lock()
+        self._local_info_refresh_lock = threading.Lock()
+        # Opened Spreadsheet handles and learned IDs, so repeat fetches skip the Drive search and metadata calls
+        self._spreadsheet_handles, self._spreadsheet_ids = {}, dict(SPREADSHEET_IDS)
+        # sheet name -> (worksheet titles found missing, checked at); they are left out of batch reads until rechecked
+        self._missing_worksheets = {}
+        # Background refresher: per-dataset intervals (seconds) and the time each dataset was last refreshed by it
+        self.BACKGROUND_REFRESH_INTERVALS = {"parking_live": 60, "parking_lots": 1800, "local_info": 600}
+        self._background_last_run = {}
+        self._background_thread, self._background_stop = None, threading.Event()
+        self.snapshot_path, self._snapshot_lock = snapshot_path, threading.Lock()
+        if preload:
+            if self._load_snapshot():
+                # Serve the snapshot right away; anything past its TTL is refreshed off the startup path
+                threading.Thread(target=self._preload_data, kwargs={"force_refresh": False}, name="BotLogicPreload", daemon=True).start()
+            else:
+                self._preload_data()
 
-    def _preload_data(self):
+    def _preload_data(self, force_refresh: bool = True):
         client = self.get_gspread_client()
         if not client:
             logger.error("Could not authorize gspread client at startup. Data fetching will be disabled.")
@@ -161,132 +315,346 @@ class BotLogic:
 
         logger.info("Pre-loading all data from Google Sheets at startup...")
         try:
-            logger.info(f"Opening spreadsheet: {GOOGLE_SHEET_LOCAL_INFO_NAME}")
-            local_info_spreadsheet = client.open(GOOGLE_SHEET_LOCAL_INFO_NAME)
-            local_info_worksheets = local_info_spreadsheet.worksheets()
-            ws_dict = {ws.title: ws for ws in local_info_worksheets}
-
-            all_local_sheets = [SHEET_HELP_CENTRES, SHEET_FIRST_AID, SHEET_TEMP_BUS_STANDS, SHEET_TOILETS, SHEET_DESIGNATED_PARKING_STATIC, SHEET_ANNADHANAM]
-            for sheet_name in all_local_sheets:
-                if sheet_name in ws_dict:
-                    records = ws_dict[sheet_name].get_all_records()
-                    self.LOCAL_INFO_CACHE[sheet_name] = records
-                    self.LAST_LOCAL_INFO_FETCH_TIME[sheet_name] = time.time()
-                    logger.info(f"Cached {len(records)} records for {sheet_name}")
-                else:
-                    logger.warning(f"Worksheet '{sheet_name}' not found in '{GOOGLE_SHEET_LOCAL_INFO_NAME}'.")
-
-            self.fetch_parking_lots_info(force_refresh=True)
-            self.fetch_parking_live_status(force_refresh=True)
+            self.fetch_all_local_info(force_refresh=force_refresh)
+            self.fetch_parking_lots_info(force_refresh=force_refresh)
+            self.fetch_parking_live_status(force_refresh=force_refresh)
             logger.info("Pre-loading complete.")
         except Exception as e:
             logger.error(f"An unexpected error occurred during preload: {e}", exc_info=True)
 
+    # --- On-disk snapshot of sheet data, used to answer instantly on cold start and while Sheets is unreachable ---
+    def _save_snapshot(self):
+        if not self.snapshot_path: return
+        snapshot = {
+            "version": SHEET_SNAPSHOT_FORMAT_VERSION, "written_at": self._clock(), "spreadsheet_ids": self._spreadsheet_ids,
+            "local_info": {ws: {"fetched_at": self.LAST_LOCAL_INFO_FETCH_TIME.get(ws, 0), "records": records} for ws, records in self.LOCAL_INFO_CACHE.items()},
+            "parking_lots": {"fetched_at": self.LAST_PARKING_LOTS_INFO_FETCH_TIME, "records": self.PARKING_LOTS_INFO_CACHE},
+            "parking_live": {"fetched_at": self.LAST_PARKING_LIVE_STATUS_FETCH_TIME, "records": list(self.PARKING_LIVE_STATUS_CACHE.values())},
+        }
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with self._snapshot_lock:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+                os.replace(tmp_path, self.snapshot_path)  # Atomic, so concurrent readers never see a partial file
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not write sheet snapshot to {self.snapshot_path}: {e}")
+            try: os.remove(tmp_path)
+            except OSError: pass
+
+    def _load_snapshot(self) -> bool:
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path): return False
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable sheet snapshot {self.snapshot_path}: {e}")
+            return False
+        if snapshot.get("version") != SHEET_SNAPSHOT_FORMAT_VERSION:
+            logger.info(f"Ignoring sheet snapshot with version {snapshot.get('version')}; expected {SHEET_SNAPSHOT_FORMAT_VERSION}.")
+            return False
+
+        self._spreadsheet_ids = {**snapshot.get("spreadsheet_ids", {}), **self._spreadsheet_ids}
+        local_info = {ws: entry for ws, entry in snapshot.get("local_info", {}).items() if entry.get("records")}
+        for ws, entry in local_info.items():
+            self._set_local_info_records(ws, entry["records"], fetched_at=entry.get("fetched_at", 0))
+        lots, live = snapshot.get("parking_lots", {}), snapshot.get("parking_live", {})
+        if lots.get("records"):
+            self._set_parking_lots_records(lots["records"], fetched_at=lots.get("fetched_at", 0))
+        if live.get("records"):
+            self._set_parking_live_records(live["records"], fetched_at=live.get("fetched_at", 0))
+        loaded = bool(self.LOCAL_INFO_CACHE or self.PARKING_LOTS_INFO_CACHE or self.PARKING_LIVE_STATUS_CACHE)
+        if loaded:
+            logger.info(f"Loaded sheet snapshot from {self.snapshot_path} (written {self._clock() - snapshot.get('written_at', 0):.0f}s ago).")
+        return loaded
+
     def _get_response_structure(self, text="", photos=None, buttons=None):
         return {"text": text, "photos": photos or [], "buttons": buttons or []}
 
-    def process_user_input(self, user_id: str, input_type: str, data: Any, user_name: str = "User") -> Dict:
-        if user_id not in self.user_states:
-            self.user_states[user_id] = {"lang": "en", "menu_level": "language_select"}
-            return self._change_language(user_id, is_initial=True, user_name=user_name)
-        
-        state = self.user_states[user_id]
+    def process_user_input(self, user_id: str, input_type: str, data: Any, user_name: str = "User", location: Optional[Tuple[float, float]] = None,
+                           session_store: Optional[SessionStore] = None) -> Dict:
+        # `session_store` overrides self.user_states for this call, e.g. a CarriedSessionStore decoded from a signed token
+        self.metrics.inc("tirubot_requests_total")
+        with self.metrics.timer("tirubot_request_duration_seconds"), self._user_locks[hash(user_id) % len(self._user_locks)]:
+            return self._process_user_input(user_id, input_type, data, user_name, location, self.user_states if session_store is None else session_store)
+
+    def _process_user_input(self, user_id: str, input_type: str, data: Any, user_name: str, location: Optional[Tuple[float, float]], store: SessionStore) -> Dict:
+        state = store.get(user_id)
+        if state is None:
+            state = {"lang": "en", "menu_level": "language_select"}
+            response = self._change_language(state, is_initial=True, user_name=user_name)
+            store[user_id] = state
+            return response
         
         if state.get("menu_level") == "language_select":
             lang_choice = str(data).strip().lower()
             if lang_choice in SUPPORTED_LANGUAGES:
                 state['lang'], state['menu_level'] = lang_choice, 'main_menu'
-                welcome_text = self.get_text(user_id, "language_selected", language_name=SUPPORTED_LANGUAGES[lang_choice]['name'])
-                return self._get_response_structure(f"{welcome_text}\n\n{self._get_menu_text('main_menu', user_id)}")
+                store[user_id] = state
+                welcome_text = self.get_text(lang_choice, "language_selected", language_name=SUPPORTED_LANGUAGES[lang_choice]['name'])
+                return self._get_response_structure(f"{welcome_text}\n\n{self._get_menu_text('main_menu', lang_choice)}")
             else:
-                return self._change_language(user_id, user_name=user_name)
+                response = self._change_language(state, user_name=user_name)
+                store[user_id] = state
+                return response
 
         text_input = str(data).strip()
         if text_input.lower() == 'x':
-            lang = state.get("lang", "en")
-            del self.user_states[user_id]
-            return self._get_response_structure(self.get_text(lang, "goodbye_message"))
+            store.pop(user_id, None)
+            return self._get_response_structure(self.get_text(state.get("lang", "en"), "goodbye_message"))
 
         handler = getattr(self, f"_handle_{state.get('menu_level', 'main_menu')}", self._handle_invalid_state)
-        return handler(user_id, text_input)
+        if location: state["location"] = location  # Per-request only; never persisted with the session
+        with self.metrics.timer("tirubot_handler_duration_seconds", handler=handler.__name__[len("_handle_"):]):
+            response = handler(state, text_input)
+        state.pop("location", None)
+        store[user_id] = state
+        return response
+
+    # --- Reply caching: which replies are a pure function of (menu level, input, language, data versions) ---
+    REPLY_CACHE_MAX_INPUT = 64
+
+    def reply_cache_key(self, user_id: str, data: Any, location: Optional[Tuple[float, float]] = None, session_store: Optional[SessionStore] = None) -> Optional[Tuple]:
+        # None when the reply depends on more than the key could capture: new sessions greet by name, "x" ends
+        # the session, location replies depend on the user's position, and stale data must reach its handler to refresh
+        state = (self.user_states if session_store is None else session_store).get(user_id)
+        if state is None: return None
+        menu_level, lang, text = state.get("menu_level"), state.get("lang", "en"), str(data).strip()
+        if text.lower() == "x" or len(text) > self.REPLY_CACHE_MAX_INPUT: return None
+        if menu_level == "language_select": return (menu_level, text.lower(), lang, None)
+        if menu_level == "parking_awaiting_route":
+            if location: return None
+            versions = self.parking_versions()
+            text = self._route_preference(text)  # Keyed by what the input means, so "tuticorin" and "2" share an entry
+        elif menu_level == "main_menu":
+            match = self._match_intent(menu_level, text)
+            if match is None: return None  # Whether it stays invalid depends on the matcher's sheet-derived vocabulary
+            text, versions = match.intent, None
+            if text in self._LOCAL_INFO_CHOICES:
+                versions = self.LOCAL_INFO_VERSION.get(self._LOCAL_INFO_CHOICES[text])
+                if versions is None: return None
+        else:
+            versions = None
+        if self._stale_datasets_for(menu_level, text): return None
+        return (menu_level, text, lang, versions)
+
+    def apply_reply_transition(self, user_id: str, next_state: Dict, session_store: Optional[SessionStore] = None):
+        # A cached reply skips the handler, so its effect on the session is replayed here
+        self.metrics.inc("tirubot_requests_total")
+        with self._user_locks[hash(user_id) % len(self._user_locks)]:
+            (self.user_states if session_store is None else session_store)[user_id] = dict(next_state)
+
+    # --- Async serving path: same conversation logic, with sheet I/O moved off the event loop ---
+    async def process_user_input_async(self, user_id: str, input_type: str, data: Any, user_name: str = "User", location: Optional[Tuple[float, float]] = None,
+                                       session_store: Optional[SessionStore] = None) -> Dict:
+        state = (self.user_states if session_store is None else session_store).get(user_id)
+        if state is not None:
+            await self._prefetch_async(state.get("menu_level"), str(data).strip())
+        token = _INLINE_SHEET_FETCH.set(False)
+        try:
+            return self.process_user_input(user_id, input_type, data, user_name=user_name, location=location, session_store=session_store)
+        finally:
+            _INLINE_SHEET_FETCH.reset(token)
+
+    # --- Batches (kiosks, SMS gateways): many users' messages answered in one call ---
+    def process_batch(self, items: List[Dict], handle: Optional[Callable[[Dict], Any]] = None) -> List:
+        """Answer ``items`` strictly in order and return one result per item.
+
+        Each item is ``{"user_id", "data"}`` plus optional ``"user_name"``, ``"location"`` and ``"session_store"``.
+        Because items run in order, a user's later messages see the state left by their earlier ones. Every
+        dataset the batch will read is refreshed once up front, concurrently, instead of message by message.
+        ``handle`` replaces ``process_user_input`` for each item; the web app passes one that consults its reply cache.
+        """
+        refreshers = list(self._stale_datasets_for_batch(items).values())
+        if refreshers:
+            for future in [self._get_io_executor().submit(refresh) for refresh in refreshers]: future.exception()
+        return [(handle or self._process_batch_item)(item) for item in items]
+
+    async def process_batch_async(self, items: List[Dict], handle: Optional[Callable[[Dict], Any]] = None) -> List:
+        # As process_batch, but the shared refresh is awaited off the event loop (bounded by SHEET_FETCH_TIMEOUT_SECONDS)
+        # and handlers never fetch inline, like process_user_input_async
+        await self._run_refreshers_async(list(self._stale_datasets_for_batch(items).values()))
+        token = _INLINE_SHEET_FETCH.set(False)
+        try:
+            return [(handle or self._process_batch_item)(item) for item in items]
+        finally:
+            _INLINE_SHEET_FETCH.reset(token)
 
-    def _handle_invalid_state(self, user_id, text_input):
-        self.user_states[user_id]["menu_level"] = "main_menu"
-        return self._get_response_structure(f"{self.get_text(user_id, 'invalid_menu_option')}\n\n{self._get_menu_text('main_menu', user_id)}")
+    def _process_batch_item(self, item: Dict) -> Dict:
+        return self.process_user_input(item["user_id"], item.get("input_type", "text"), item["data"], user_name=item.get("user_name", "User"),
+                                       location=item.get("location"), session_store=item.get("session_store"))
 
-    def _handle_main_menu(self, user_id, choice):
+    def _stale_datasets_for_batch(self, items: List[Dict]) -> Dict[str, Any]:
+        # A user's first message is read at their current menu level; their later ones could land at either
+        # data-reading level depending on what comes before, so both are considered
+        stale, seen = {}, set()
+        for item in items:
+            user_id, text = item["user_id"], str(item["data"]).strip()
+            if user_id in seen:
+                levels = ("main_menu", "parking_awaiting_route")
+            else:
+                seen.add(user_id)
+                state = (self.user_states if item.get("session_store") is None else item["session_store"]).get(user_id)
+                levels = (state.get("menu_level"),) if state else ()
+            for menu_level in levels: stale.update(self._stale_datasets_for(menu_level, text))
+        return stale
+
+    def _get_io_executor(self) -> ThreadPoolExecutor:
+        if self._io_executor is None:
+            with self._io_executor_lock:
+                if self._io_executor is None:
+                    self._io_executor = ThreadPoolExecutor(max_workers=SHEET_IO_WORKERS, thread_name_prefix="sheet-io")
+        return self._io_executor
+
+    _LOCAL_INFO_CHOICES = {"3": SHEET_HELP_CENTRES, "4": SHEET_FIRST_AID, "5": SHEET_TEMP_BUS_STANDS, "6": SHEET_TOILETS, "7": SHEET_ANNADHANAM}
+
+    def _stale_datasets_for(self, menu_level: Optional[str], text_input: str) -> Dict[str, Any]:
+        # Refresh callables for the datasets the next handler will read, if they are past their TTL, keyed by dataset
+        match = self._match_intent(menu_level, text_input) if menu_level == "main_menu" else None
+        if match is not None and match.intent in self._LOCAL_INFO_CHOICES:
+            worksheet_name = self._LOCAL_INFO_CHOICES[match.intent]
+            return {} if self._is_local_info_fresh(worksheet_name) else {worksheet_name: lambda: self.fetch_local_info_from_sheet(worksheet_name)}
+        if menu_level == "parking_awaiting_route":
+            return {**({} if self._is_parking_lots_fresh() else {"parking_lots": self.fetch_parking_lots_info}),
+                    **({} if self._is_parking_live_fresh() else {"parking_live": self.fetch_parking_live_status})}
+        return {}
+
+    async def _prefetch_async(self, menu_level: Optional[str], text_input: str):
+        await self._run_refreshers_async(list(self._stale_datasets_for(menu_level, text_input).values()))
+
+    async def _run_refreshers_async(self, refreshers: List):
+        if not refreshers: return
+        import asyncio  # Already loaded by the async server whenever this runs; kept off the import path for sync users
+        loop = asyncio.get_running_loop()
+        futures = [loop.run_in_executor(self._get_io_executor(), refresh) for refresh in refreshers]
+        try:
+            await asyncio.wait_for(asyncio.gather(*futures), timeout=SHEET_FETCH_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            self.metrics.inc("tirubot_async_prefetch_timeouts_total")
+            # The fetch keeps running on the pool (and later requests coalesce onto it); answer now from what we have
+            logger.warning(f"Sheet refresh exceeded {SHEET_FETCH_TIMEOUT_SECONDS}s; serving cached data.")
+        except Exception as e:
+            logger.error(f"Async sheet refresh failed: {e}", exc_info=True)
+
+    # --- Free-text input: option numbers, names and typos in either language resolve to the same action ---
+    def _main_menu_matcher(self) -> IntentMatcher:
+        # LOCAL_INFO_VERSION is replaced (never mutated) on every sheet refresh, so identity tells us when to rebuild.
+        # Records are published before the version, so at worst a newer vocabulary is kept under an older version.
+        versions, cached = self.LOCAL_INFO_VERSION, self._main_menu_matcher_cache
+        if cached is None or cached[0] is not versions:
+            cached = self._main_menu_matcher_cache = (versions, build_main_menu_matcher(self.LOCAL_INFO_CACHE))
+        return cached[1]
+
+    def _match_intent(self, menu_level: str, text_input: str) -> Optional[IntentMatch]:
+        if menu_level == "main_menu":
+            return IntentMatch(text_input, 1.0, True) if text_input in MAIN_MENU_SYNONYMS else self._main_menu_matcher().match(text_input)
+        if text_input in PARKING_ROUTE_CHOICES: return IntentMatch(PARKING_ROUTE_CHOICES[text_input], 1.0, True)
+        return self._parking_route_matcher.match(text_input)
+
+    def _route_preference(self, text_input: str) -> str:
+        match = self._match_intent("parking_awaiting_route", text_input)
+        return match.intent if match else "any"
+
+    def _record_intent_match(self, menu_level: str, match: Optional[IntentMatch]):
+        result = "unmatched" if match is None else "exact" if match.exact else "fuzzy"
+        self.metrics.inc("tirubot_intent_matches_total", menu=menu_level, result=result)
+
+    def _handle_invalid_state(self, state, text_input):
+        state["menu_level"] = "main_menu"
+        lang = state["lang"]
+        return self._get_response_structure(f"{self.get_text(lang, 'invalid_menu_option')}\n\n{self._get_menu_text('main_menu', lang)}")
+
+    def _handle_main_menu(self, state, choice):
+        lang = state["lang"]
         menu_actions = {
             "1": ("parking_awaiting_route", None), "2": ("temple_info_menu", None),
-            "3": (None, lambda: self._get_formatted_sheet_data(user_id, SHEET_HELP_CENTRES)),
-            "4": (None, lambda: self._get_formatted_sheet_data(user_id, SHEET_FIRST_AID)),
-            "5": (None, lambda: self._get_formatted_sheet_data(user_id, SHEET_TEMP_BUS_STANDS)),
-            "6": (None, lambda: self._get_formatted_sheet_data(user_id, SHEET_TOILETS)),
-            "7": (None, lambda: self._get_formatted_sheet_data(user_id, SHEET_ANNADHANAM)),
-            "8": (None, lambda: self.get_text(user_id, "emergency_contacts_info")),
-            "9": ("nearby_search", None), "10": (None, lambda: self._change_language(user_id)),
-            "11": (None, lambda: self.get_text(user_id, "feedback_response", feedback_link=GOOGLE_FORM_FEEDBACK_LINK)),
+            "3": (None, lambda: self._get_formatted_sheet_data(lang, SHEET_HELP_CENTRES)),
+            "4": (None, lambda: self._get_formatted_sheet_data(lang, SHEET_FIRST_AID)),
+            "5": (None, lambda: self._get_formatted_sheet_data(lang, SHEET_TEMP_BUS_STANDS)),
+            "6": (None, lambda: self._get_formatted_sheet_data(lang, SHEET_TOILETS)),
+            "7": (None, lambda: self._get_formatted_sheet_data(lang, SHEET_ANNADHANAM)),
+            "8": (None, lambda: self.get_text(lang, "emergency_contacts_info")),
+            "9": ("nearby_search", None), "10": (None, lambda: self._change_language(state)),
+            "11": (None, lambda: self.get_text(lang, "feedback_response", feedback_link=GOOGLE_FORM_FEEDBACK_LINK)),
         }
-        new_level, action = menu_actions.get(choice, (None, None))
+        match = self._match_intent("main_menu", choice)
+        self._record_intent_match("main_menu", match)
+        new_level, action = menu_actions.get(match.intent, (None, None)) if match else (None, None)
 
         if new_level:
-            self.user_states[user_id]["menu_level"] = new_level
+            state["menu_level"] = new_level
             prompt_map = {"parking_awaiting_route": "parking_route_prompt", "temple_info_menu": "temple_info_menu_prompt", "nearby_search": "freestyle_query_prompt"}
-            return self._get_response_structure(self.get_text(user_id, prompt_map[new_level]))
+            response = self._get_response_structure(self.get_text(lang, prompt_map[new_level]))
+            # Only the route reply uses the user's position, so the page asks for it now and sends it with that reply alone
+            if new_level == "parking_awaiting_route": response["wants_location"] = True
+            return response
         
         elif action:
             result = action()
             if isinstance(result, dict): return result
-            return self._get_response_structure(f"{result}\n\n{self._get_menu_text('main_menu', user_id)}")
+            return self._get_response_structure(f"{result}\n\n{self._get_menu_text('main_menu', lang)}")
         
-        return self._handle_invalid_state(user_id, choice)
+        return self._handle_invalid_state(state, choice)
 
-    def _handle_temple_info_menu(self, user_id, choice):
+    def _handle_temple_info_menu(self, state, choice):
+        lang = state["lang"]
         if choice == "0": 
-            self.user_states[user_id]["menu_level"] = "main_menu"
-            return self._get_response_structure(self._get_menu_text("main_menu", user_id))
+            state["menu_level"] = "main_menu"
+            return self._get_response_structure(self._get_menu_text("main_menu", lang))
 
         response = self._get_response_structure()
         
         if choice == "1":
-            response["text"] = self.get_text(user_id, "temple_timings_details")
+            response["text"] = self.get_text(lang, "temple_timings_details")
             response["photos"] = ['assets/nadai_thirappu_neram.png', 'assets/pooja_vivaram.png']
         elif choice == "2":
-            response["text"] = self.get_text(user_id, "temple_dress_code_details")
+            response["text"] = self.get_text(lang, "temple_dress_code_details")
         elif choice == "3":
-            response["text"] = self.get_text(user_id, "temple_seva_details_intro")
+            response["text"] = self.get_text(lang, "temple_seva_details_intro")
             response["photos"] = ['assets/sevai_kattanam.png']
         else:
-            response["text"] = self.get_text(user_id, "invalid_menu_option")
+            response["text"] = self.get_text(lang, "invalid_menu_option")
+
+        response["text"] += f"\n\n{self._get_menu_text('temple_info_menu', lang)}"
+        return response
 
-        response["text"] += f"\n\n{self._get_menu_text('temple_info_menu', user_id)}"
+    def _handle_parking_awaiting_route(self, state, text_input):
+        state["menu_level"] = "main_menu"
+        lang = state["lang"]
+        match = self._match_intent("parking_awaiting_route", text_input)
+        self._record_intent_match("parking_awaiting_route", match)
+        route_pref = match.intent if match else "any"
+        if state.get("location"):
+            parking_reply = self.find_parking_near_user(state["location"][0], state["location"][1], lang, route_preference=route_pref)
+        else:
+            parking_reply = self.find_available_parking(self.TIRUCHENDUR_COORDS[0], self.TIRUCHENDUR_COORDS[1], lang, route_preference=route_pref)
+        response = self._get_response_structure(f"{parking_reply}\n\n{self._get_menu_text('main_menu', lang)}")
+        response["parking_live"] = lang  # Tells the page to offer a "live availability" button for this language
         return response
 
-    def _handle_parking_awaiting_route(self, user_id, text_input):
-        self.user_states[user_id]["menu_level"] = "main_menu"
-        choice = text_input.lower()
-        route_pref = "any"
-        if "1" in choice or "tirunelveli" in choice: route_pref = "tirunelveli"
-        elif "2" in choice or "thoothukudi" in choice: route_pref = "thoothukudi"
-        elif "3" in choice or "nagercoil" in choice: route_pref = "nagercoil"
-        parking_reply = self.find_available_parking(self.TIRUCHENDUR_COORDS[0], self.TIRUCHENDUR_COORDS[1], user_id, route_preference=route_pref)
-        return self._get_response_structure(f"{parking_reply}\n\n{self._get_menu_text('main_menu', user_id)}")
-
-    def _handle_nearby_search(self, user_id, text_input):
-        self.user_states[user_id]["menu_level"] = "main_menu"
-        search_reply = self.find_nearby_place(self.TIRUCHENDUR_COORDS[0], self.TIRUCHENDUR_COORDS[1], text_input, user_id=user_id)
-        return self._get_response_structure(f"{search_reply}\n\n{self._get_menu_text('main_menu', user_id)}")
-
-    def _change_language(self, user_id, is_initial=False, user_name="User"):
-        self.user_states[user_id]['menu_level'] = 'language_select'
+    def _handle_nearby_search(self, state, text_input):
+        state["menu_level"] = "main_menu"
+        lang = state["lang"]
+        search_reply = self.find_nearby_place(self.TIRUCHENDUR_COORDS[0], self.TIRUCHENDUR_COORDS[1], text_input, lang)
+        return self._get_response_structure(f"{search_reply}\n\n{self._get_menu_text('main_menu', lang)}")
+
+    def _change_language(self, state, is_initial=False, user_name="User"):
+        state['menu_level'] = 'language_select'
         text = (self.get_text("en", "welcome_tiruchendur", user_name=user_name) + "\n") if is_initial else ""
         text += self.get_text("en", "select_language_prompt")
         buttons = [{"text": d["name"], "payload": c} for c, d in SUPPORTED_LANGUAGES.items()]
         return self._get_response_structure(text=text, buttons=buttons)
 
+    def _resolve_lang(self, lang_code_or_user_id) -> str:
+        # Accepts either a language code or a user_id whose session holds one
+        if lang_code_or_user_id in SUPPORTED_LANGUAGES: return lang_code_or_user_id
+        return (self.user_states.get(lang_code_or_user_id) or {}).get("lang", "en")
+
     def get_text(self, lang_code, key, **kwargs):
-        lang = lang_code if lang_code in SUPPORTED_LANGUAGES else self.user_states.get(lang_code, {}).get("lang", "en")
-        template_string = MENU_TEXTS.get(lang, MENU_TEXTS["en"]).get(key, f"<{key}_MISSING>")
-        if kwargs:
+        lang = self._resolve_lang(lang_code)
+        template_string = COMPILED_MENU_TEXTS[lang].get(key)
+        if template_string is None: return f"<{key}_MISSING>"
+        if kwargs and TEMPLATE_FIELDS.get(key, True):
             try: return template_string.format(**kwargs)
             except KeyError as e:
                 logger.error(f"Formatting failed for key '{key}'. Missing placeholder: {e}")
@@ -294,16 +662,30 @@ class BotLogic:
         return template_string
 
     def _get_menu_text(self, menu_type, user_id):
-        keys = {
-            "main_menu": ["main_menu_prompt", "option_parking_availability", "option_temple_info", "option_help_centres", "option_first_aid", "option_temp_bus_stands", "option_toilets_temple", "option_annadhanam", "option_emergency_contacts", "option_nearby_facilities", "option_change_language", "option_feedback", "option_end_conversation_text"], 
-            "temple_info_menu": ["temple_info_menu_prompt", "temple_timings_menu_item", "temple_dress_code_menu_item", "temple_seva_tickets_menu_item", "option_go_back_text"]
-        }.get(menu_type, [])
-        return "\n".join([self.get_text(user_id, k) for k in keys])
+        return COMPILED_MENUS[self._resolve_lang(user_id)].get(menu_type, "")
 
     def get_gspread_client(self, force_reauth=False):
-        if self.gspread_client and not force_reauth:
-            return self.gspread_client
+        client, generation = self.gspread_client, self._client_generation
+        if client and not force_reauth:
+            return client
+        # Single-flight auth: threads that queued behind a successful re-auth reuse its client
+        with self._client_lock:
+            if self.gspread_client and (not force_reauth or self._client_generation != generation):
+                return self.gspread_client
+            return self._authorize_gspread_client(force_reauth)
+
+    def _invalidate_gspread_client(self, client):
+        # Only drop the client that actually failed, not one another thread has just authorized
+        with self._client_lock:
+            if self.gspread_client is client:
+                self.gspread_client, self._spreadsheet_handles = None, {}
+
+    def _authorize_gspread_client(self, force_reauth):
+        # Imported here rather than at module level: together they cost ~150 ms, paid only when Sheets is first needed
+        import gspread
+        from google.oauth2.service_account import Credentials
         logger.info(f"Authorizing gspread client. Force re-auth: {force_reauth}")
+        self._spreadsheet_handles = {}  # Handles are bound to the old client's session
         scopes = ['https://www.googleapis.com/auth/spreadsheets.readonly', 'https://www.googleapis.com/auth/drive.readonly']
         google_creds_json = os.getenv("GOOGLE_CREDENTIALS_JSON")
         
@@ -318,62 +700,398 @@ class BotLogic:
                 return None
             
             self.gspread_client = gspread.authorize(creds)
+            self._client_generation += 1
+            self.metrics.inc("tirubot_sheets_reauth_total", result="success")
             logger.info("gspread client authorized successfully.")
             return self.gspread_client
         except Exception as e:
+            self.metrics.inc("tirubot_sheets_reauth_total", result="failure")
             logger.error(f"Gspread auth error: {e}", exc_info=True)
             self.gspread_client = None
             return None
 
-    def fetch_sheet_data(self, sheet_name, worksheet_name, force_reauth=False):
-        logger.info(f"Attempting to fetch data from {sheet_name}/{worksheet_name}.")
+    def _open_spreadsheet(self, client, sheet_name: str):
+        spreadsheet = self._spreadsheet_handles.get(sheet_name)
+        if spreadsheet is None:
+            key = self._spreadsheet_ids.get(sheet_name)
+            spreadsheet = self._open_by_key(client, sheet_name, key) if key else None
+            if spreadsheet is None:
+                self.metrics.inc("tirubot_sheets_api_calls_total", spreadsheet=sheet_name, call="open")
+                spreadsheet = client.open(sheet_name)
+            self._spreadsheet_ids = {**self._spreadsheet_ids, sheet_name: spreadsheet.id}
+            self._spreadsheet_handles = {**self._spreadsheet_handles, sheet_name: spreadsheet}
+        return spreadsheet
+
+    def _open_by_key(self, client, sheet_name: str, key: str):
+        # None when an ID learned from an earlier search by name no longer resolves (the spreadsheet was re-created
+        # or replaced under the same name); the ID is forgotten so the caller searches by name again
+        from gspread.exceptions import SpreadsheetNotFound
+        self.metrics.inc("tirubot_sheets_api_calls_total", spreadsheet=sheet_name, call="open_by_key")
+        try:
+            return client.open_by_key(key)
+        except Exception as e:
+            if not (isinstance(e, SpreadsheetNotFound) or api_status(e) == 404) or SPREADSHEET_IDS.get(sheet_name) == key: raise
+            logger.warning(f"Spreadsheet ID {key} learned for '{sheet_name}' no longer resolves; opening it by name.")
+            self._forget_spreadsheet(sheet_name)
+            return None
+
+    def _forget_spreadsheet(self, sheet_name: str):
+        # Drops the open handle and any learned ID; IDs configured through the *_ID environment variables are kept
+        self._spreadsheet_handles = {k: v for k, v in self._spreadsheet_handles.items() if k != sheet_name}
+        if sheet_name not in SPREADSHEET_IDS:
+            self._spreadsheet_ids = {k: v for k, v in self._spreadsheet_ids.items() if k != sheet_name}
+
+    @staticmethod
+    def _values_to_records(values: List[List[Any]]) -> List[Dict]:
+        # Same shape as Worksheet.get_all_records(): first row is the header, cells are numericised, short rows padded
+        if not values: return []
+        from gspread.utils import fill_gaps, numericise_all, to_records
+        values = fill_gaps(values)
+        headers, rows = values[0], values[1:]
+        return to_records(headers, [numericise_all(row) for row in rows])
+
+    def fetch_sheet_batch(self, sheet_name: str, worksheet_names, force_reauth=False) -> Dict[str, List[Dict]]:
+        logger.info(f"Attempting to batch-fetch {list(worksheet_names)} from {sheet_name}.")
+        # Checked before authorizing, so an open circuit also stops every request from re-authorizing
+        if not self.sheets_guard.is_available(sheet_name):
+            self.metrics.inc("tirubot_sheets_throttled_total", spreadsheet=sheet_name, reason="circuit_open")
+            logger.warning(f"Circuit for {sheet_name} is open; serving last good data.")
+            return {}
         client = self.get_gspread_client(force_reauth=force_reauth)
         if not client: 
             logger.error(f"Cannot fetch data for {sheet_name}; gspread client is not available.")
-            return []
+            return {}
+        started = time.perf_counter()
         try:
-            spreadsheet = client.open(sheet_name)
-            worksheet = spreadsheet.worksheet(worksheet_name)
-            records = worksheet.get_all_records()
-            logger.info(f"Successfully fetched {len(records)} records from {sheet_name}/{worksheet_name}.")
-            return records
-        except gspread.exceptions.APIError as e:
-            if e.response.status_code == 429:
-                logger.warning(f"Quota exceeded for {sheet_name}. Retrying may be needed later.")
+            # Opening an uncached spreadsheet is one more request against the budget
+            cost = 1 if sheet_name in self._spreadsheet_handles else 2
+            results = self.sheets_guard.call(sheet_name, lambda: self._fetch_value_ranges(client, sheet_name, worksheet_names), cost=cost)
+            logger.info(f"Successfully fetched {sum(len(r) for r in results.values())} records from {len(results)} worksheet(s) of {sheet_name}.")
+            return results
+        except SheetsUnavailable as e:
+            self.metrics.inc("tirubot_sheets_throttled_total", spreadsheet=sheet_name, reason=e.reason)
+            logger.warning(f"{e}; serving last good data.")
+        except Exception as e:
+            # gspread's APIError carries the HTTP response; matching on it avoids importing gspread for the except clause
+            status = api_status(e)
+            if status is None:
+                logger.error(f"Unexpected error fetching sheet {sheet_name}: {e}", exc_info=True)
+            elif status == 429:
+                logger.warning(f"Quota exceeded for {sheet_name} after retries; serving last good data.")
             else:
                  logger.error(f"GSpread API Error fetching {sheet_name}: {e}")
-            if e.response.status_code in [401, 403]:
-                self.gspread_client = None
+            if status in [401, 403]:
+                self._invalidate_gspread_client(client)
+            elif status == 404:
+                self._forget_spreadsheet(sheet_name)
+        finally:
+            self.metrics.observe("tirubot_sheet_fetch_duration_seconds", time.perf_counter() - started, spreadsheet=sheet_name)
+        return {}
+
+    def _fetch_value_ranges(self, client, sheet_name: str, worksheet_names) -> Dict[str, List[Dict]]:
+        spreadsheet = self._open_spreadsheet(client, sheet_name)
+        missing, checked_at = self._missing_worksheets.get(sheet_name, (frozenset(), 0))
+        if self._clock() - checked_at >= self.STATIC_DATA_CACHE_DURATION: missing = frozenset()  # Recheck; a tab may be back
+        names = [ws for ws in worksheet_names if ws not in missing]
+        if not names: return {}
+        try:
+            value_ranges = self._values_batch_get(spreadsheet, sheet_name, names)
         except Exception as e:
-            logger.error(f"Unexpected error fetching sheet {sheet_name}: {e}", exc_info=True)
-        return []
+            # One renamed or deleted tab fails the whole batch with 400 "Unable to parse range". Look up which tabs
+            # exist (one metadata request) and read the rest, so a single bad tab doesn't cost all local info.
+            if api_status(e) != 400: raise
+            self.metrics.inc("tirubot_sheets_api_calls_total", spreadsheet=sheet_name, call="worksheets")
+            titles = {ws.title for ws in spreadsheet.worksheets()}
+            missing = frozenset(ws for ws in worksheet_names if ws not in titles)
+            if not missing.intersection(names): raise
+            logger.warning(f"Worksheet(s) {sorted(missing)} not found in '{sheet_name}'; fetching the others.")
+            self._missing_worksheets = {**self._missing_worksheets, sheet_name: (missing, self._clock())}
+            names = [ws for ws in names if ws not in missing]
+            if not names: return {}
+            value_ranges = self._values_batch_get(spreadsheet, sheet_name, names)
+        # The API returns one valueRange per requested range, in request order
+        return {ws: self._values_to_records(vr.get("values", [])) for ws, vr in zip(names, value_ranges)}
+
+    def _values_batch_get(self, spreadsheet, sheet_name: str, worksheet_names) -> List[Dict]:
+        from gspread.utils import absolute_range_name
+        self.metrics.inc("tirubot_sheets_api_calls_total", spreadsheet=sheet_name, call="values_batch_get")
+        return spreadsheet.values_batch_get([absolute_range_name(ws) for ws in worksheet_names]).get("valueRanges", [])
+
+    def fetch_sheet_data(self, sheet_name, worksheet_name, force_reauth=False):
+        return self.fetch_sheet_batch(sheet_name, [worksheet_name], force_reauth=force_reauth).get(worksheet_name, [])
+
+    def _set_local_info_records(self, worksheet_name: str, records: List[Dict], fetched_at: Optional[float] = None):
+        # Copy-on-write: readers holding the previous dict never observe a half-updated cache
+        self.LOCAL_INFO_CACHE = {**self.LOCAL_INFO_CACHE, worksheet_name: records}
+        self.LAST_LOCAL_INFO_FETCH_TIME = {**self.LAST_LOCAL_INFO_FETCH_TIME, worksheet_name: self._clock() if fetched_at is None else fetched_at}
+        # Rendered replies carry the version they were built from, so bumping it invalidates them atomically
+        self.LOCAL_INFO_VERSION = {**self.LOCAL_INFO_VERSION, worksheet_name: next(self._data_versions)}
+
+    def _is_local_info_fresh(self, worksheet_name: str):
+        return bool(self.LOCAL_INFO_CACHE.get(worksheet_name)) and (self._clock() - self.LAST_LOCAL_INFO_FETCH_TIME.get(worksheet_name, 0) < self.LOCAL_INFO_CACHE_DURATION)
+
+    def _load_local_info(self) -> bool:
+        # All local-info worksheets come back in a single values-batchGet request
+        results = self.fetch_sheet_batch(GOOGLE_SHEET_LOCAL_INFO_NAME, LOCAL_INFO_WORKSHEETS)
+        for worksheet_name in LOCAL_INFO_WORKSHEETS:
+            records = results.get(worksheet_name)
+            if records:
+                self._set_local_info_records(worksheet_name, records)
+                logger.info(f"Cached {len(records)} records for {worksheet_name}")
+            elif results:
+                logger.warning(f"Worksheet '{worksheet_name}' in '{GOOGLE_SHEET_LOCAL_INFO_NAME}' returned no records.")
+        if not any(results.values()): return False
+        self._save_snapshot()
+        return True
+
+    def fetch_all_local_info(self, force_refresh: bool = False):
+        all_fresh = lambda: all(self._is_local_info_fresh(ws) for ws in LOCAL_INFO_WORKSHEETS)
+        if not force_refresh and all_fresh():
+            return
+        self._refresh_cached_dataset(self._local_info_refresh_lock, (lambda: False) if force_refresh else all_fresh, bool(self.LOCAL_INFO_CACHE), self._load_local_info, "local info")
+
+    def _record_cache_lookup(self, cache: str, fresh: bool, has_data: bool):
+        self.metrics.inc("tirubot_cache_requests_total", cache=cache, result="hit" if fresh else ("stale" if has_data else "miss"))
+
+    def _collect_dataset_ages(self) -> Dict:
+        now = self._clock()
+        fetch_times = {"parking_lots": self.LAST_PARKING_LOTS_INFO_FETCH_TIME, "parking_live": self.LAST_PARKING_LIVE_STATUS_FETCH_TIME}
+        fetch_times.update({f"local_info/{ws}": t for ws, t in self.LAST_LOCAL_INFO_FETCH_TIME.items()})
+        return {(("dataset", dataset),): max(0.0, now - t) for dataset, t in fetch_times.items() if t}
 
     def fetch_local_info_from_sheet(self, worksheet_name: str, force_refresh: bool = False):
-        last_fetch = self.LAST_LOCAL_INFO_FETCH_TIME.get(worksheet_name, 0)
-        if not force_refresh and (time.time() - last_fetch < self.LOCAL_INFO_CACHE_DURATION):
+        has_data = bool(self.LOCAL_INFO_CACHE.get(worksheet_name))
+        if not force_refresh: self._record_cache_lookup("local_info", self._is_local_info_fresh(worksheet_name), has_data)
+        if not force_refresh and (self._is_local_info_fresh(worksheet_name) or (has_data and self.is_background_refresh_running())):
             return
-        
-        if force_refresh or not self.LOCAL_INFO_CACHE.get(worksheet_name):
-            records = self.fetch_sheet_data(GOOGLE_SHEET_LOCAL_INFO_NAME, worksheet_name)
-            if records:
-                self.LOCAL_INFO_CACHE[worksheet_name] = records
-                self.LAST_LOCAL_INFO_FETCH_TIME[worksheet_name] = time.time()
+        # A stale worksheet refreshes all of them, since the batch costs the same single request
+        is_fresh = (lambda: False) if force_refresh else (lambda: self._is_local_info_fresh(worksheet_name))
+        self._refresh_cached_dataset(self._local_info_refresh_lock, is_fresh, has_data, self._load_local_info, "local info")
 
-    def fetch_parking_lots_info(self, force_refresh: bool = False):
-        if not force_refresh and (time.time() - self.LAST_PARKING_LOTS_INFO_FETCH_TIME < self.STATIC_DATA_CACHE_DURATION) and self.PARKING_LOTS_INFO_CACHE:
+    def _refresh_cached_dataset(self, lock: threading.Lock, is_fresh, has_data: bool, loader, dataset_name: str):
+        if not _INLINE_SHEET_FETCH.get():
+            logger.debug(f"Inline fetch of {dataset_name} skipped on the async path; serving cached data.")
+            return
+        # Coalesce concurrent refreshes: if a fetch is already in flight and we have data to serve, don't queue behind it.
+        if not lock.acquire(blocking=not has_data):
+            logger.debug(f"Refresh of {dataset_name} already in flight; serving cached data.")
             return
+        try:
+            if is_fresh():  # Another request refreshed it while we were waiting for the lock
+                return
+            if not loader():
+                if has_data: logger.warning(f"Refresh of {dataset_name} failed; serving stale data.")
+                else: logger.error(f"Refresh of {dataset_name} failed and no cached data is available.")
+        finally:
+            lock.release()
+
+    def _is_parking_lots_fresh(self):
+        return bool(self.PARKING_LOTS_INFO_CACHE) and (self._clock() - self.LAST_PARKING_LOTS_INFO_FETCH_TIME < self.STATIC_DATA_CACHE_DURATION)
+
+    def _is_parking_live_fresh(self):
+        max_age = self.PARKING_RECONCILE_INTERVAL if self._parking_deltas_active() else self.LIVE_DATA_CACHE_DURATION
+        return bool(self.PARKING_LIVE_STATUS_CACHE) and (self._clock() - self.LAST_PARKING_LIVE_STATUS_FETCH_TIME < max_age)
+
+    def _parking_deltas_active(self) -> bool:
+        return bool(self.LAST_PARKING_DELTA_TIME) and self._clock() - self.LAST_PARKING_DELTA_TIME < self.LIVE_DATA_CACHE_DURATION
+
+    def _set_parking_lots_records(self, records: List[Dict], fetched_at: Optional[float] = None):
+        self._parking_index = ParkingLotIndex(records)
+        self.PARKING_LOTS_INFO_CACHE = records
+        self.LAST_PARKING_LOTS_INFO_FETCH_TIME = self._clock() if fetched_at is None else fetched_at
+        self.PARKING_LOTS_VERSION = next(self._data_versions)
+        self._notify_parking_watchers()
+
+    def _set_parking_live_records(self, records: List[Dict], fetched_at: Optional[float] = None, replay_deltas_since: Optional[float] = None):
+        # replay_deltas_since: when the sheet read began. Deltas applied from then on may be missing from the rows
+        # just read, so they are re-applied on top; older ones are taken to be reflected in the sheet and dropped.
+        with self._parking_live_write_lock:  # A delta batch never lands on the dict this replaces
+            live = {str(r['ParkingLotID']): r for r in records if 'ParkingLotID' in r}
+            if replay_deltas_since is not None:
+                log = self._parking_delta_log
+                while log and log[0][0] < replay_deltas_since: log.popleft()
+                for _, lot_id, entered, exited in log:
+                    live[lot_id] = self._apply_parking_delta(live.get(lot_id), lot_id, entered, exited)
+            self.PARKING_LIVE_STATUS_CACHE = live
+            self.LAST_PARKING_LIVE_STATUS_FETCH_TIME = self._clock() if fetched_at is None else fetched_at
+            self.PARKING_LIVE_VERSION = next(self._data_versions)
+        self._notify_parking_watchers()
+
+    @staticmethod
+    def _apply_parking_delta(record: Optional[Dict], lot_id: str, entered: int, exited: int) -> Dict:
+        record = dict(record or {"ParkingLotID": lot_id, "CurrentIn": 0, "CurrentOut": 0, "CurrentAvailability": ""})
+        record["CurrentIn"] = to_int(record.get("CurrentIn"), 0) + entered
+        record["CurrentOut"] = to_int(record.get("CurrentOut"), 0) + exited
+        # A manually entered availability figure moves with the traffic instead of going stale
+        override = to_int(record.get("CurrentAvailability"), -1)
+        if override != -1: record["CurrentAvailability"] = max(0, override - (entered - exited))
+        return record
+
+    def apply_parking_deltas(self, updates: List[Dict]) -> Dict:
+        """Apply gate-counter deltas, e.g. ``[{"ParkingLotID": 3, "CurrentIn": 12, "CurrentOut": 4}]``.
+
+        The live-status dict is copied, patched and swapped in like every other cache, and only the updated
+        lots' availability rows are recomputed. An update is rejected, with the reason, when its lot is missing
+        from the lots sheet or a count is not a number; the rest of the batch still applies.
+        """
+        applied, rejected = [], []
+        with self._parking_live_write_lock:
+            live, index, now = dict(self.PARKING_LIVE_STATUS_CACHE), self._parking_index, self._clock()
+            for update in updates:
+                lot_id = str(update.get("ParkingLotID", "")).strip() if isinstance(update, dict) else ""
+                if not lot_id:
+                    rejected.append({"ParkingLotID": None, "error": "missing ParkingLotID"})
+                    continue
+                if lot_id not in index.row_of:
+                    rejected.append({"ParkingLotID": lot_id, "error": "unknown lot"})
+                    continue
+                counts = [0 if value in (None, "") else to_int(value, None) for value in (update.get("CurrentIn"), update.get("CurrentOut"))]
+                if None in counts:
+                    rejected.append({"ParkingLotID": lot_id, "error": "CurrentIn and CurrentOut must be numbers"})
+                    continue
+                entered, exited = counts
+                live[lot_id] = self._apply_parking_delta(live.get(lot_id), lot_id, entered, exited)
+                self._parking_delta_log.append((now, lot_id, entered, exited))
+                applied.append(lot_id)
+            if applied:
+                self.PARKING_LIVE_STATUS_CACHE = live
+                versions, cached = (self.PARKING_LOTS_VERSION, self.PARKING_LIVE_VERSION), self._parking_availability
+                patched = None
+                if cached is not None and cached[0] == versions and cached[1] is index:
+                    patched = index.patch_availability(cached[2], cached[3], live, applied)
+                self.LAST_PARKING_DELTA_TIME = self._clock()
+                self.PARKING_LIVE_VERSION = next(self._data_versions)
+                if patched is not None:
+                    self._parking_availability = ((self.PARKING_LOTS_VERSION, self.PARKING_LIVE_VERSION), index) + patched
+        if applied: self._notify_parking_watchers()
+        self.metrics.inc("tirubot_parking_deltas_total", len(applied), result="applied")
+        if rejected: self.metrics.inc("tirubot_parking_deltas_total", len(rejected), result="rejected")
+        return {"applied": len(applied), "rejected": rejected, "version": self.PARKING_LIVE_VERSION}
+
+    def _load_parking_lots_info(self) -> bool:
         records = self.fetch_sheet_data(GOOGLE_SHEET_PARKING_LOTS_INFO_NAME, "Sheet1")
-        if records:
-            self.PARKING_LOTS_INFO_CACHE = records
-            self.LAST_PARKING_LOTS_INFO_FETCH_TIME = time.time()
-            
+        if not records: return False
+        self._set_parking_lots_records(records)
+        self._save_snapshot()
+        return True
+
+    def _load_parking_live_status(self) -> bool:
+        started = self._clock()
+        records = self.fetch_sheet_data(GOOGLE_SHEET_PARKING_STATUS_LIVE_NAME, "Sheet1")
+        if not records: return False
+        self._set_parking_live_records(records, replay_deltas_since=started)
+        self._save_snapshot()
+        return True
+
+    def _get_parking_availability(self):
+        # (index, available slots, percentage full) for the current lots and live-status versions
+        index, versions = self._parking_index, (self.PARKING_LOTS_VERSION, self.PARKING_LIVE_VERSION)
+        cached = self._parking_availability
+        if cached is None or cached[0] != versions or cached[1] is not index:
+            available, percentage_full = index.availability(self.PARKING_LIVE_STATUS_CACHE)
+            cached = self._parking_availability = (versions, index, available, percentage_full)
+        return cached[1], cached[2], cached[3]
+
+    # --- Live availability feed: one shared snapshot per data version, however many subscribers ---
+    def parking_versions(self) -> Tuple[int, int]:
+        return self.PARKING_LOTS_VERSION, self.PARKING_LIVE_VERSION
+
+    def _notify_parking_watchers(self):
+        with self._parking_changed:
+            self._parking_changed.notify_all()
+
+    def wait_for_parking_change(self, versions: Tuple[int, int], timeout: float) -> Tuple[int, int]:
+        # Blocks until the lots or live-status version differs from `versions` (or the timeout passes); returns the current versions
+        with self._parking_changed:
+            self._parking_changed.wait_for(lambda: self.parking_versions() != versions, timeout)
+        return self.parking_versions()
+
+    def parking_availability_feed(self, lang: str = "en") -> Dict:
+        """Compact per-lot availability: ``{"versions": [lots, live], "names": {id: name}, "lots": {id: [available, capacity, percent_full]}}``."""
+        lang = lang if lang in SUPPORTED_LANGUAGES else "en"
+        versions = self.parking_versions()
+        cached = self._parking_feed_cache.get(lang)
+        if cached and cached["versions"] == list(versions): return cached
+        index, available, percentage_full = self._get_parking_availability()
+        feed = {
+            "versions": list(versions),
+            "names": {lot_id: lot.get(f"Parking_name_{lang}", lot.get("Parking_name_en")) for lot_id, lot in zip(index.lot_ids, index.records)},
+            "lots": {lot_id: [int(available[i]), int(index.capacities[i]), round(float(percentage_full[i]))] for i, lot_id in enumerate(index.lot_ids)},
+        }
+        self._parking_feed_cache = {**self._parking_feed_cache, lang: feed}
+        return feed
+
+    def fetch_parking_lots_info(self, force_refresh: bool = False):
+        if not force_refresh: self._record_cache_lookup("parking_lots", self._is_parking_lots_fresh(), bool(self.PARKING_LOTS_INFO_CACHE))
+        if not force_refresh and (self._is_parking_lots_fresh() or (self.PARKING_LOTS_INFO_CACHE and self.is_background_refresh_running())):
+            return
+        is_fresh = (lambda: False) if force_refresh else self._is_parking_lots_fresh
+        self._refresh_cached_dataset(self._parking_lots_refresh_lock, is_fresh, bool(self.PARKING_LOTS_INFO_CACHE), self._load_parking_lots_info, "parking lots info")
+
     def fetch_parking_live_status(self, force_refresh: bool = False):
-        if not force_refresh and (time.time() - self.LAST_PARKING_LIVE_STATUS_FETCH_TIME < self.LIVE_DATA_CACHE_DURATION) and self.PARKING_LIVE_STATUS_CACHE:
+        if not force_refresh: self._record_cache_lookup("parking_live", self._is_parking_live_fresh(), bool(self.PARKING_LIVE_STATUS_CACHE))
+        if not force_refresh and (self._is_parking_live_fresh() or (self.PARKING_LIVE_STATUS_CACHE and self.is_background_refresh_running())):
             return
-        records = self.fetch_sheet_data(GOOGLE_SHEET_PARKING_STATUS_LIVE_NAME, "Sheet1")
-        if records:
-            self.PARKING_LIVE_STATUS_CACHE = {str(r['ParkingLotID']): r for r in records if 'ParkingLotID' in r}
-            self.LAST_PARKING_LIVE_STATUS_FETCH_TIME = time.time()
+        is_fresh = (lambda: False) if force_refresh else self._is_parking_live_fresh
+        self._refresh_cached_dataset(self._parking_live_refresh_lock, is_fresh, bool(self.PARKING_LIVE_STATUS_CACHE), self._load_parking_live_status, "parking live status")
+
+    # --- Background refresher: keeps every sheet-backed cache warm so handlers only read snapshots ---
+    def run_due_refreshes(self, now: Optional[float] = None) -> List[str]:
+        now = self._clock() if now is None else now
+        refreshers = {
+            "parking_live": self._reconcile_parking_live,
+            "parking_lots": lambda: self.fetch_parking_lots_info(force_refresh=True),
+            "local_info": lambda: self.fetch_all_local_info(force_refresh=True),
+        }
+        refreshed = []
+        for dataset, refresh in refreshers.items():
+            interval = self.BACKGROUND_REFRESH_INTERVALS.get(dataset)
+            if interval is None or now - self._background_last_run.get(dataset, float("-inf")) < interval:
+                continue
+            try:
+                refresh()
+            except Exception as e:
+                logger.error(f"Background refresh of {dataset} failed: {e}", exc_info=True)
+            self._background_last_run[dataset] = now
+            refreshed.append(dataset)
+        return refreshed
+
+    def _reconcile_parking_live(self):
+        # While deltas are flowing they are the source of truth; the sheet is only re-read every PARKING_RECONCILE_INTERVAL
+        if self._parking_deltas_active() and self._is_parking_live_fresh(): return
+        self.fetch_parking_live_status(force_refresh=True)
+
+    def _background_refresh_loop(self, tick_seconds: float):
+        logger.info("Background refresher started.")
+        while not self._background_stop.is_set():
+            self.run_due_refreshes()
+            self._background_stop.wait(tick_seconds)
+        logger.info("Background refresher stopped.")
+
+    def start_background_refresh(self, tick_seconds: float = 5.0):
+        with self._background_lock:
+            self._start_background_refresh(tick_seconds)
+
+    def _start_background_refresh(self, tick_seconds: float):
+        if self.is_background_refresh_running():
+            return
+        # Data already loaded at startup doesn't need an immediate second fetch
+        now = self._clock()
+        for dataset, last_fetch in (("parking_live", self.LAST_PARKING_LIVE_STATUS_FETCH_TIME), ("parking_lots", self.LAST_PARKING_LOTS_INFO_FETCH_TIME), ("local_info", min(self.LAST_LOCAL_INFO_FETCH_TIME.values(), default=0))):
+            if last_fetch: self._background_last_run.setdefault(dataset, min(last_fetch, now))
+        self._background_stop.clear()
+        self._background_thread = threading.Thread(target=self._background_refresh_loop, args=(tick_seconds,), name="BotLogicRefresher", daemon=True)
+        self._background_thread.start()
+
+    def stop_background_refresh(self, timeout: Optional[float] = None):
+        with self._background_lock:
+            self._background_stop.set()
+            if self._background_thread:
+                self._background_thread.join(timeout)
+            self._background_thread = None
+
+    def is_background_refresh_running(self) -> bool:
+        return bool(self._background_thread and self._background_thread.is_alive())
 
     def _generate_embed_link(self, query: str = "", mode: str = "place", origin: str = "", destination: str = "", my_map_id: str = "") -> str:
         if my_map_id: return f"https://www.google.com/maps/d/embed?mid={my_map_id}"
@@ -385,14 +1103,26 @@ class BotLogic:
         else: return ""
         return url
 
-    def _get_formatted_sheet_data(self, user_id: str, worksheet_name: str) -> str:
-        data_items = self.LOCAL_INFO_CACHE.get(worksheet_name)
-        if not data_items:
-            self.fetch_local_info_from_sheet(worksheet_name, force_refresh=True)
-            data_items = self.LOCAL_INFO_CACHE.get(worksheet_name, [])
+    def _get_formatted_sheet_data(self, lang: str, worksheet_name: str) -> str:
+        self.fetch_local_info_from_sheet(worksheet_name)  # No-op while fresh; single-flight refresh once past its TTL
+        version = self.LOCAL_INFO_VERSION.get(worksheet_name)
+        cached = self._local_info_render_cache.get((worksheet_name, lang))
+        if cached and version is not None and cached[0] == version:
+            self.metrics.inc("tirubot_cache_requests_total", cache="local_info_render", result="hit")
+            return cached[1]
+        self.metrics.inc("tirubot_cache_requests_total", cache="local_info_render", result="stale" if cached else "miss")
 
-        lang = self.user_states[user_id].get("lang", "en")
-        
+        # Writers publish records before the version, so reading the version first can at worst cache
+        # fresh text under an old version (re-rendered next time), never stale text under a new one
+        version = self.LOCAL_INFO_VERSION.get(worksheet_name)
+        data_items = self.LOCAL_INFO_CACHE.get(worksheet_name) or []
+
+        text = self._render_local_info(worksheet_name, lang, data_items)
+        if data_items and version is not None:
+            self._local_info_render_cache = {**self._local_info_render_cache, (worksheet_name, lang): (version, text)}
+        return text
+
+    def _render_local_info(self, worksheet_name: str, lang: str, data_items: List[Dict]) -> str:
         format_map = {
             SHEET_HELP_CENTRES: ("option_help_centres", "local_info_item_format", "View Map"),
             SHEET_FIRST_AID: ("option_first_aid", "local_info_item_format", "View Map"),
@@ -405,15 +1135,15 @@ class BotLogic:
         if not category_key: return "Error: Unknown data category."
         
         if worksheet_name == SHEET_DESIGNATED_PARKING_STATIC: category_name = category_key
-        else: category_name = self.get_text(user_id, category_key).split('. ', 1)[-1]
+        else: category_name = self.get_text(lang, category_key).split('. ', 1)[-1]
         
         if not data_items:
             logger.warning(f"No data for {worksheet_name}. Check sheet content/permissions.")
-            return self.get_text(user_id, "no_local_info_found", category_name=category_name)
+            return self.get_text(lang, "no_local_info_found", category_name=category_name)
         
-        title = self.get_text(user_id, "local_info_title_format", category_name=category_name)
+        title = self.get_text(lang, "local_info_title_format", category_name=category_name)
         reply_parts = [title]
-        item_template = self.get_text(user_id, item_format_key)
+        item_template = self.get_text(lang, item_format_key)
         
         for item in data_items:
             format_kwargs = defaultdict(lambda: 'N/A', item)
@@ -429,67 +1159,68 @@ class BotLogic:
         return "".join(reply_parts)
         
     def haversine(self, lat1, lon1, lat2, lon2):
-        R = 6371; dLat, dLon = radians(lat2 - lat1), radians(lon2 - lon1)
-        a = sin(dLat / 2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dLon / 2)**2
-        return R * 2 * atan2(sqrt(a), sqrt(1 - a))
+        return haversine_km(lat1, lon1, lat2, lon2)
 
-    def find_available_parking(self, user_lat: float, user_lon: float, user_id: str, route_preference: Optional[str] = None) -> str:
-        self.fetch_parking_lots_info(force_refresh=True)
-        self.fetch_parking_live_status(force_refresh=True)
+    def find_available_parking(self, user_lat: float, user_lon: float, lang: str, route_preference: Optional[str] = None, rank_by_distance: bool = False) -> str:
+        self.fetch_parking_lots_info()
+        self.fetch_parking_live_status()
         
-        current_lang = self.user_states[user_id].get("lang", "en")
-        applicable_lots = [lot for lot in self.PARKING_LOTS_INFO_CACHE if (not route_preference or route_preference == "any" or route_preference.lower() in str(lot.get("Route_en", "any")).strip().lower())]
+        index, available, percentage_full = self._get_parking_availability()
+        applicable = index.route_filter(route_preference)
 
-        if not applicable_lots:
+        if not applicable:
             logger.warning(f"No parking lots found in sheet for route preference: {route_preference}")
-            return self.get_text(user_id, "no_parking_available")
-
-        processed_lots = []
-        for lot in applicable_lots:
-            try:
-                lat, lon, capacity = float(lot.get('Latitude')), float(lot.get('Longitude')), int(lot.get('TotalCapacity', 0))
-            except (ValueError, TypeError):
-                logger.warning(f"Skipping lot due to invalid Lat/Lon/Capacity: {lot.get('Parking_name_en')}")
-                continue
-            if capacity <= 0: continue
+            return self.get_text(lang, "no_parking_available")
 
-            status = self.PARKING_LIVE_STATUS_CACHE.get(str(lot.get('ParkingLotID')), {})
-            available = int(status.get('CurrentAvailability', -1))
-            if available == -1: available = capacity - max(0, int(status.get('CurrentIn', 0)) - int(status.get('CurrentOut', 0)))
-            percentage_full = ((capacity - available) / capacity * 100) if capacity > 0 else 100
-
-            if available > 0 and percentage_full < self.PARKING_FULL_THRESHOLD_PERCENT:
-                lot_data = lot.copy()
-                lot_data.update({"Availability": available, "PercentageFull": percentage_full, "Distance": self.haversine(user_lat, user_lon, lat, lon), "Latitude": lat, "Longitude": lon, "TotalCapacity": capacity})
-                processed_lots.append(lot_data)
-
-        if not processed_lots: 
+        sorted_lots = index.select_available(user_lat, user_lon, applicable, available, percentage_full, self.PARKING_FULL_THRESHOLD_PERCENT, rank_by_distance=rank_by_distance)
+        if not sorted_lots: 
             logger.info(f"All lots for route {route_preference} are full or unavailable based on the threshold.")
-            return self.get_text(user_id, "no_parking_available")
+            return self.get_text(lang, "no_parking_available")
 
-        sorted_lots = sorted(processed_lots, key=lambda x: (int(x.get('Priority', 99)), x['Distance']))
-        
-        title = self.get_text(user_id, "parking_for_route_title" if route_preference and route_preference != "any" else "parking_info_title", RouteName=route_preference.capitalize())
+        title = self.get_text(lang, "parking_for_route_title" if route_preference and route_preference != "any" else "parking_info_title", RouteName=route_preference.capitalize())
         
         details_list = []
-        for lot in sorted_lots: # Show all available lots
-            embed_url = self._generate_embed_link(mode="directions", origin=f"{user_lat},{user_lon}", destination=f"{lot['Latitude']},{lot['Longitude']}")
+        for i, distance in sorted_lots: # Show all available lots
+            lot = index.records[i]
+            embed_url = self._generate_embed_link(mode="directions", origin=f"{user_lat},{user_lon}", destination=f"{index.lats[i]},{index.lons[i]}")
             maps_link = f'<a href="{embed_url}" data-embed="true">Get Directions</a>' if embed_url else "Directions unavailable"
-            details_list.append(self.get_text(user_id, "parking_lot_details_format", ParkingName=lot.get(f"Parking_name_{current_lang}", lot.get("Parking_name_en")), Distance=lot['Distance'], Availability=lot['Availability'], TotalCapacity=lot['TotalCapacity'], PercentageFull=lot['PercentageFull'], MapsLink=maps_link))
+            details_list.append(self.get_text(lang, "parking_lot_details_format", ParkingName=lot.get(f"Parking_name_{lang}", lot.get("Parking_name_en")), Distance=distance, Availability=int(available[i]), TotalCapacity=int(index.capacities[i]), PercentageFull=float(percentage_full[i]), MapsLink=maps_link))
         
         final_response = f"{title}\n" + "\n".join(details_list)
 
         if route_preference and route_preference in OVERALL_ROUTE_MY_MAPS:
             my_map_id = OVERALL_ROUTE_MY_MAPS[route_preference]
             overall_map_embed_url = self._generate_embed_link(my_map_id=my_map_id)
-            final_response += self.get_text(user_id, "overall_parking_map_link_text", overall_map_url=overall_map_embed_url, RouteName=route_preference.capitalize())
+            final_response += self.get_text(lang, "overall_parking_map_link_text", overall_map_url=overall_map_embed_url, RouteName=route_preference.capitalize())
 
         return final_response
 
-    def find_nearby_place(self, lat: float, lon: float, search_query: str, user_id=None) -> str:
+    def find_parking_near_user(self, user_lat: float, user_lon: float, lang: str, route_preference: Optional[str] = None) -> str:
+        # Lots ranked by distance from the user. The location is snapped to a grid cell so everyone on the same
+        # stretch of road shares one computation until the lots or live status change.
+        self.fetch_parking_lots_info()
+        self.fetch_parking_live_status()
+        step = self.PARKING_LOCATION_CELL_DEGREES
+        cell = (round(user_lat / step), round(user_lon / step))
+        key = (route_preference or "any", lang, cell, self.PARKING_LOTS_VERSION, self.PARKING_LIVE_VERSION)
+        with self._parking_location_cache_lock:
+            reply = self._parking_location_cache.get(key)
+            if reply is not None:
+                self._parking_location_cache.move_to_end(key)
+        self.metrics.inc("tirubot_cache_requests_total", cache="parking_location", result="miss" if reply is None else "hit")
+        if reply is not None:
+            return reply
+        reply = self.find_available_parking(round(cell[0] * step, 6), round(cell[1] * step, 6), lang, route_preference=route_preference, rank_by_distance=True)
+        with self._parking_location_cache_lock:
+            self._parking_location_cache[key] = reply
+            while len(self._parking_location_cache) > self.PARKING_LOCATION_CACHE_SIZE:
+                self._parking_location_cache.popitem(last=False)
+        return reply
+
+    def find_nearby_place(self, lat: float, lon: float, search_query: str, lang: str = "en") -> str:
         place_type_display_name = search_query.replace('_', ' ').title()
         embed_url = self._generate_embed_link(f"{search_query} in Tiruchendur", mode="search", origin=f"{lat},{lon}")
         maps_url_html = f'<a href="{embed_url}" data-embed="true">View on Map</a>' if embed_url else "Map not available"
         
-        return (f'{self.get_text(user_id, "nearest_place_intro", place_type_display_name=place_type_display_name)}'
-                f'{self.get_text(user_id, "place_details_maps", name=f"Results for {place_type_display_name}", address="Click the link below to see locations on the map.", maps_url=maps_url_html)}')
+        return (f'{self.get_text(lang, "nearest_place_intro", place_type_display_name=place_type_display_name)}'
+                f'{self.get_text(lang, "place_details_maps", name=f"Results for {place_type_display_name}", address="Click the link below to see locations on the map.", maps_url=maps_url_html)}')
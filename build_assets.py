@@ -0,0 +1,113 @@
+# build_assets.py
+# -*- coding: utf-8 -*-
+#
+# Build-time image pipeline for the temple-info photos. For every PNG/JPEG in static/assets/ it writes
+# AVIF, WebP and optimised source-format variants at a few widths into static/assets/build/, named by
+# content hash, plus the manifest.json from which app.py describes each photo as a <picture> (the browser
+# picks the format and width). The variants are plain files under static/, served by Vercel's static
+# builder with an immutable Cache-Control (see vercel.json). Run it after changing an image and commit
+# the output:
+#
+#   pip install Pillow          # build-time only; not a runtime dependency
+#   python build_assets.py
+#
+# AVIF needs Pillow >= 11.2 (or the pillow-avif-plugin package); without it only WebP variants are made.
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+
+from assets import ASSET_BUILD_DIR, ASSET_DISPLAY_WIDTH, ASSET_MANIFEST_PATH, BASE_DIR, AssetManifest
+
+SOURCE_DIR = os.path.join(BASE_DIR, "static", "assets")
+SOURCE_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg"}
+WIDTHS = (480, ASSET_DISPLAY_WIDTH)  # Plus the original width when it is narrower than the widest of these
+ENCODERS = {
+    # media type -> (extension, Pillow format, save options)
+    "image/avif": ("avif", "AVIF", {"quality": 60, "speed": 4}),
+    "image/webp": ("webp", "WEBP", {"quality": 80, "method": 6}),
+    "image/png": ("png", "PNG", {"optimize": True}),
+    "image/jpeg": ("jpg", "JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def encode(image, media_type: str) -> bytes:
+    from io import BytesIO
+    _, pillow_format, options = ENCODERS[media_type]
+    if pillow_format == "JPEG" and image.mode not in ("RGB", "L"): image = image.convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, pillow_format, **options)
+    return buffer.getvalue()
+
+
+def build_asset(source_path: str, media_types, out_dir: str) -> dict:
+    from PIL import Image
+    with open(source_path, "rb") as f:
+        source_bytes = f.read()
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    source_type = SOURCE_TYPES[os.path.splitext(source_path)[1].lower()]
+    entry = {"hash": content_hash(source_bytes), "type": source_type, "bytes": len(source_bytes), "variants": []}
+    with Image.open(source_path) as original:
+        original.load()
+        # Larger-than-display variants would never be sent to the chat, so they aren't built (or committed)
+        widths = sorted({w for w in WIDTHS if w < original.width} | ({original.width} if original.width <= max(WIDTHS) else set()))
+        for width in widths:
+            resized = original if width == original.width else original.resize((width, round(original.height * width / original.width)), Image.LANCZOS)
+            for media_type in list(media_types) + [source_type]:
+                data = encode(resized, media_type)
+                if media_type == source_type and width == original.width and len(data) >= len(source_bytes):
+                    data = source_bytes  # The encoder couldn't beat the original file; ship it unchanged
+                file_name = f"{stem}.{width}.{content_hash(data)}.{ENCODERS[media_type][0]}"
+                with open(os.path.join(out_dir, file_name), "wb") as f:
+                    f.write(data)
+                entry["variants"].append({"file": file_name, "type": media_type, "width": width, "bytes": len(data)})
+    return entry
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate compressed, content-hashed variants of static/assets images.")
+    parser.add_argument("--no-avif", action="store_true", help="Skip AVIF even if Pillow supports it.")
+    args = parser.parse_args(argv)
+
+    try:
+        from PIL import features
+    except ImportError:
+        sys.exit("Pillow is required to build assets: pip install Pillow")
+    try:
+        import pillow_avif  # noqa: F401  Registers the AVIF codec on Pillow < 11.2
+    except ImportError:
+        pass
+    media_types = [t for t, feature in (("image/avif", "avif"), ("image/webp", "webp")) if features.check(feature) and not (args.no_avif and feature == "avif")]
+    if "image/avif" not in media_types and not args.no_avif:
+        print("AVIF encoding unavailable in this Pillow build; generating WebP only.", file=sys.stderr)
+
+    os.makedirs(ASSET_BUILD_DIR, exist_ok=True)
+    assets = {}
+    for name in sorted(os.listdir(SOURCE_DIR)):
+        path = os.path.join(SOURCE_DIR, name)
+        if not os.path.isfile(path) or os.path.splitext(name)[1].lower() not in SOURCE_TYPES: continue
+        relative = f"assets/{name}"  # Same form as the photo paths BotLogic returns
+        assets[relative] = build_asset(path, media_types, ASSET_BUILD_DIR)
+        picture = AssetManifest(assets).picture(relative)  # What a modern browser's chat gets: the widest preferred source
+        best = picture["sources"][0]["srcset"][-1][0] if picture["sources"] else picture["src"]
+        served = next(v for v in assets[relative]["variants"] if v["file"] == os.path.basename(best))
+        print(f"{relative}: {assets[relative]['bytes'] / 1024:.0f} KB -> {served['bytes'] / 1024:.0f} KB ({served['type']}, {served['width']} px)")
+
+    # Drop variants left over from earlier builds
+    keep = {v["file"] for entry in assets.values() for v in entry["variants"]} | {os.path.basename(ASSET_MANIFEST_PATH)}
+    for name in os.listdir(ASSET_BUILD_DIR):
+        if name not in keep: os.remove(os.path.join(ASSET_BUILD_DIR, name))
+    with open(ASSET_MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump({"assets": assets}, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"Wrote {sum(len(e['variants']) for e in assets.values())} variants and {ASSET_MANIFEST_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# intent_matcher.py
+# -*- coding: utf-8 -*-
+
+import unicodedata
+from collections import defaultdict, namedtuple
+from typing import Dict, Iterable, List, Optional, Tuple
+
+NGRAM = 3
+# Filler that carries no intent in either language; "near" is here because "nearby" (option 9) is the meaningful form
+STOPWORDS = frozenset({
+    "a", "an", "the", "is", "are", "am", "of", "for", "to", "in", "at", "on", "and", "or", "me", "my", "i", "you", "we",
+    "want", "need", "show", "give", "tell", "where", "what", "which", "how", "please", "pls", "about", "details",
+    "info", "information", "list", "any", "near", "etc", "option", "number", "no",
+})
+
+# exact: the whole message was a registered phrase (e.g. "3" or "toilets"), so no n-gram scoring was needed
+IntentMatch = namedtuple("IntentMatch", ["intent", "score", "exact"])
+_MISSING = object()  # Memo sentinel; None is a legitimate (unmatched) result
+
+
+def tokenize(text: str) -> Tuple[str, ...]:
+    # Letters, combining marks and digits form words. Tamil vowel signs are combining marks (category M), which
+    # the re module's \w does not treat as word characters, so splitting on \W would cut Tamil words apart.
+    text = unicodedata.normalize("NFC", text).casefold()
+    chars = [ch if unicodedata.category(ch)[0] in "LMN" else " " for ch in text]
+    return tuple("".join(chars).split())
+
+
+def ngrams(word: str) -> frozenset:
+    padded = f" {word} "
+    return frozenset(padded[i:i + NGRAM] for i in range(len(padded) - NGRAM + 1))
+
+
+class IntentMatcher:
+    """Maps free text to one of a fixed set of intents using phrases registered with ``add``.
+
+    A message is resolved by, in order: an exact lookup of the whole normalized message; exact lookups of its
+    words; and, for words not in the vocabulary, the most similar vocabulary word by n-gram overlap (an
+    inverted index from n-gram to word, so typos cost a few dict lookups rather than a scan). Each word votes
+    for the intents it was registered under, split evenly when it belongs to several, and the best intent
+    wins only if it beats the runner-up.
+    """
+
+    def __init__(self, min_similarity: float = 0.45, min_score: float = 0.4, memo_size: int = 4096):
+        self.min_similarity, self.min_score, self.memo_size = min_similarity, min_score, memo_size
+        self._phrases: Dict[str, str] = {}
+        self._words: Dict[str, Dict[str, float]] = defaultdict(dict)  # word -> {intent: weight}
+        self._ngram_index: Dict[str, List[str]] = defaultdict(list)  # n-gram -> vocabulary words containing it
+        self._word_ngrams: Dict[str, frozenset] = {}
+        self._memo: Dict[Tuple[str, ...], Optional[IntentMatch]] = {}
+
+    def add(self, intent: str, phrase: str, weight: float = 1.0, exact: bool = True):
+        # exact=False only contributes words, for phrases too generic to claim a whole message (e.g. sheet item names)
+        tokens = tokenize(phrase)
+        if not tokens: return
+        if exact: self._phrases.setdefault(" ".join(tokens), intent)
+        for word in tokens:
+            if word in STOPWORDS or (not exact and word.isdigit()): continue
+            self._words[word][intent] = max(weight, self._words[word].get(intent, 0.0))
+            if word not in self._word_ngrams and len(word) >= NGRAM:
+                self._word_ngrams[word] = grams = ngrams(word)
+                for gram in grams: self._ngram_index[gram].append(word)
+        self._memo.clear()
+
+    def add_all(self, intent: str, phrases: Iterable[str], weight: float = 1.0, exact: bool = True):
+        for phrase in phrases: self.add(intent, phrase, weight=weight, exact=exact)
+
+    def closest_word(self, word: str) -> Tuple[Optional[str], float]:
+        # Most similar vocabulary word by Dice coefficient over padded n-grams
+        if len(word) < NGRAM or word.isdigit(): return None, 0.0
+        grams = ngrams(word)
+        shared = defaultdict(int)
+        for gram in grams:
+            for candidate in self._ngram_index.get(gram, ()): shared[candidate] += 1
+        best, best_similarity = None, 0.0
+        for candidate, common in shared.items():
+            similarity = 2 * common / (len(grams) + len(self._word_ngrams[candidate]))
+            if similarity > best_similarity: best, best_similarity = candidate, similarity
+        return (best, best_similarity) if best_similarity >= self.min_similarity else (None, 0.0)
+
+    def match(self, text: str) -> Optional[IntentMatch]:
+        tokens = tokenize(text)
+        if not tokens: return None
+        result = self._memo.get(tokens, _MISSING)  # One lookup: another thread may clear the memo between two
+        if result is not _MISSING: return result
+        result = self._match_tokens(tokens)
+        if self.memo_size:  # 0 disables memoization (the benchmark uses this to time cold lookups)
+            if len(self._memo) >= self.memo_size: self._memo.clear()
+            self._memo[tokens] = result
+        return result
+
+    def _match_tokens(self, tokens: Tuple[str, ...]) -> Optional[IntentMatch]:
+        intent = self._phrases.get(" ".join(tokens))
+        if intent is not None: return IntentMatch(intent, 1.0, True)
+        scores = defaultdict(float)
+        for word in tokens:
+            if word in STOPWORDS: continue
+            similarity = 1.0
+            if word not in self._words:
+                word, similarity = self.closest_word(word)
+                if word is None: continue
+            intents = self._words[word]
+            for intent, weight in intents.items(): scores[intent] += weight * similarity / len(intents)
+        if not scores: return None
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        best_intent, best_score = ranked[0]
+        if best_score < self.min_score or (len(ranked) > 1 and ranked[1][1] >= best_score): return None
+        return IntentMatch(best_intent, round(best_score, 3), False)
+
+    def __len__(self) -> int:
+        return len(self._words)
@@ -0,0 +1,109 @@
+# metrics.py
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Tuple
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help). Every metric BotLogic emits is declared here so /metrics always lists it, even at zero.
+METRIC_DEFINITIONS = {
+    "tirubot_requests_total": ("counter", "Conversation messages processed."),
+    "tirubot_request_duration_seconds": ("histogram", "Time spent in process_user_input."),
+    "tirubot_handler_duration_seconds": ("histogram", "Time spent in each _handle_* menu handler."),
+    "tirubot_cache_requests_total": ("counter", "Cache lookups by cache and result (hit, miss, stale)."),
+    "tirubot_sheet_fetch_duration_seconds": ("histogram", "Time spent fetching a spreadsheet, including failures."),
+    "tirubot_sheets_api_calls_total": ("counter", "Requests sent to the Google Sheets/Drive APIs."),
+    "tirubot_sheets_api_errors_total": ("counter", "Sheets API errors by HTTP status."),
+    "tirubot_sheets_reauth_total": ("counter", "gspread client authorizations."),
+    "tirubot_sheets_throttled_total": ("counter", "Sheets fetches refused locally by the rate limiter or an open circuit."),
+    "tirubot_sheets_quota_remaining": ("gauge", "Sheets requests left in the local token bucket."),
+    "tirubot_sheets_circuit_open": ("gauge", "1 while a spreadsheet's circuit breaker is open or probing."),
+    "tirubot_intent_matches_total": ("counter", "Menu inputs by how they resolved: exact option/phrase, fuzzy match, or unmatched."),
+    "tirubot_async_prefetch_timeouts_total": ("counter", "Async requests that stopped waiting for a sheet refresh."),
+    "tirubot_parking_deltas_total": ("counter", "Per-lot live parking deltas received, by result (applied, rejected)."),
+    "tirubot_dataset_age_seconds": ("gauge", "Seconds since each dataset was last fetched from Sheets."),
+    "tirubot_sessions": ("gauge", "Conversation sessions currently held by the session store."),
+}
+
+
+def _label_key(labels: Dict[str, str]) -> Tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(label_key: Tuple, extra: Tuple = ()) -> str:
+    pairs = label_key + extra
+    if not pairs: return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Metrics:
+    """Minimal in-process Prometheus registry: labelled counters, histograms and scrape-time gauges."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}    # (name, label_key) -> float
+        self._histograms = {}  # (name, label_key) -> [bucket counts..., sum, count]
+        self._gauges = {}      # name -> collector callable, see register_gauge
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None: series = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound: series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def register_gauge(self, name: str, collect: Callable[[], Dict]):
+        # collect() returns {((label, value), ...): metric value}; it only runs at scrape time
+        self._gauges[name] = collect
+
+    def render(self) -> str:
+        with self._lock:
+            counters, histograms = dict(self._counters), {k: list(v) for k, v in self._histograms.items()}
+        lines = []
+        for name, (kind, help_text) in METRIC_DEFINITIONS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (metric, label_key), value in sorted(counters.items()):
+                    if metric == name: lines.append(f"{name}{_format_labels(label_key)} {value:g}")
+            elif kind == "histogram":
+                for (metric, label_key), series in sorted(histograms.items()):
+                    if metric != name: continue
+                    for bound, bucket_count in zip(self.buckets, series):
+                        lines.append(f"{name}_bucket{_format_labels(label_key, (('le', f'{bound:g}'),))} {bucket_count}")
+                    lines.append(f"{name}_bucket{_format_labels(label_key, (('le', '+Inf'),))} {series[-1]}")
+                    lines.append(f"{name}_sum{_format_labels(label_key)} {series[-2]:.6f}")
+                    lines.append(f"{name}_count{_format_labels(label_key)} {series[-1]}")
+            elif kind == "gauge" and name in self._gauges:
+                try:
+                    values = self._gauges[name]()
+                except Exception:  # A broken collector must never take the scrape down
+                    values = {}
+                for labels, value in sorted(values.items()):
+                    lines.append(f"{name}{_format_labels(_label_key(dict(labels)))} {value:g}")
+        return "\n".join(lines) + "\n"
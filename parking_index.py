@@ -0,0 +1,144 @@
+# parking_index.py
+# -*- coding: utf-8 -*-
+
+import logging
+from array import array
+from math import radians, sin, cos, sqrt, atan2
+from typing import Dict, List, Optional, Tuple
+
+# NumPy is optional; the pure-Python path gives identical results for our lot counts. It is imported when the
+# first index is built rather than with this module, since it alone costs ~50 ms of startup.
+np, _numpy_checked = None, False
+
+
+def _import_numpy():
+    global np, _numpy_checked
+    if _numpy_checked: return
+    try:
+        import numpy
+        np = numpy
+    except ImportError:
+        pass
+    _numpy_checked = True
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+DEFAULT_PRIORITY = 99
+# Known arrival routes; a lot's Route_en may name several of them (e.g. "Nagercoil, Tirunelveli")
+ROUTE_BITS = {"tirunelveli": 1, "thoothukudi": 2, "nagercoil": 4}
+
+
+def to_int(value, default: int) -> int:
+    # Sheet cells come back as ints, floats, numeric strings or "" for blanks
+    if value is None or value == "": return default
+    try: return int(float(value))
+    except (ValueError, TypeError): return default
+
+
+def available_slots(capacity: int, status: Dict) -> int:
+    # A filled-in CurrentAvailability wins; otherwise derive free slots from the gate counts
+    slots = to_int(status.get('CurrentAvailability'), -1)
+    if slots == -1: slots = capacity - max(0, to_int(status.get('CurrentIn'), 0) - to_int(status.get('CurrentOut'), 0))
+    return int(slots)
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> float:
+    dLat, dLon = radians(lat2 - lat1), radians(lon2 - lon1)
+    a = sin(dLat / 2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dLon / 2)**2
+    return EARTH_RADIUS_KM * 2 * atan2(sqrt(a), sqrt(1 - a))
+
+
+class ParkingLotIndex:
+    """Parking lot geometry and capacity parsed once per sheet refresh into parallel arrays.
+
+    Row ``i`` of every array describes ``records[i]``. Availability is computed separately from
+    the live-status sheet (see ``availability``) so the static index survives live refreshes.
+    """
+
+    def __init__(self, lot_records: List[Dict]):
+        _import_numpy()
+        self.records, self.lot_ids, self.route_texts = [], [], []
+        lats, lons, capacities, priorities, route_masks = array("d"), array("d"), array("l"), array("l"), array("l")
+        for lot in lot_records:
+            try:
+                lat, lon, capacity = float(lot.get('Latitude')), float(lot.get('Longitude')), int(lot.get('TotalCapacity', 0))
+            except (ValueError, TypeError):
+                logger.warning(f"Skipping lot due to invalid Lat/Lon/Capacity: {lot.get('Parking_name_en')}")
+                continue
+            if capacity <= 0: continue
+            route_text = str(lot.get("Route_en", "any")).strip().lower()
+            self.records.append(lot)
+            self.lot_ids.append(str(lot.get('ParkingLotID')))
+            self.route_texts.append(route_text)
+            lats.append(lat); lons.append(lon); capacities.append(capacity)
+            priorities.append(to_int(lot.get('Priority'), DEFAULT_PRIORITY))
+            route_masks.append(sum(bit for route, bit in ROUTE_BITS.items() if route in route_text))
+
+        if np is not None:
+            self.lats, self.lons = np.frombuffer(lats, dtype=np.float64), np.frombuffer(lons, dtype=np.float64)
+            self.capacities, self.priorities = np.asarray(capacities, dtype=np.int64), np.asarray(priorities, dtype=np.int64)
+            self.route_masks = np.asarray(route_masks, dtype=np.int64)
+            self._lat_rad, self._lon_rad = np.radians(self.lats), np.radians(self.lons)
+            self._cos_lat = np.cos(self._lat_rad)
+        else:
+            self.lats, self.lons, self.capacities, self.priorities, self.route_masks = lats, lons, capacities, priorities, route_masks
+
+        self.row_of = {lot_id: i for i, lot_id in enumerate(self.lot_ids)}
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def route_filter(self, route_preference: Optional[str]) -> List[int]:
+        # Indices of lots serving the route; "any"/None matches every lot
+        if not route_preference or route_preference == "any":
+            return list(range(len(self.records)))
+        route = route_preference.lower()
+        bit = ROUTE_BITS.get(route)
+        if bit is not None:
+            if np is not None: return np.flatnonzero(self.route_masks & bit).tolist()
+            return [i for i in range(len(self.records)) if self.route_masks[i] & bit]
+        return [i for i, text in enumerate(self.route_texts) if route in text]
+
+    def distances_km(self, lat: float, lon: float, indices: Optional[List[int]] = None):
+        if np is not None:
+            idx = slice(None) if indices is None else np.asarray(indices, dtype=np.int64)
+            lat_r, lon_r = radians(lat), radians(lon)
+            a = np.sin((self._lat_rad[idx] - lat_r) / 2)**2 + cos(lat_r) * self._cos_lat[idx] * np.sin((self._lon_rad[idx] - lon_r) / 2)**2
+            return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+        indices = range(len(self.records)) if indices is None else indices
+        return [haversine_km(lat, lon, self.lats[i], self.lons[i]) for i in indices]
+
+    def availability(self, live_status: Dict[str, Dict]):
+        # Returns (available slots, percentage full) aligned with the index rows
+        available = [available_slots(capacity, live_status.get(lot_id, {})) for lot_id, capacity in zip(self.lot_ids, self.capacities)]
+        if np is not None:
+            available = np.asarray(available, dtype=np.int64)
+            return available, (self.capacities - available) / self.capacities * 100
+        return available, [(capacity - slots) / capacity * 100 for capacity, slots in zip(self.capacities, available)]
+
+    def patch_availability(self, available, percentage_full, live_status: Dict[str, Dict], lot_ids):
+        # Copy of an ``availability`` result with only the rows of ``lot_ids`` recomputed
+        available, percentage_full = (available.copy(), percentage_full.copy()) if np is not None else (list(available), list(percentage_full))
+        for lot_id in lot_ids:
+            i = self.row_of.get(lot_id)
+            if i is None: continue
+            capacity = int(self.capacities[i])
+            available[i] = available_slots(capacity, live_status.get(lot_id, {}))
+            percentage_full[i] = (capacity - available[i]) / capacity * 100
+        return available, percentage_full
+
+    def select_available(self, lat: float, lon: float, indices: List[int], available, percentage_full, full_threshold: float, rank_by_distance: bool = False) -> List[Tuple[int, float]]:
+        # Lots with free slots below the fullness threshold, as (index, distance) sorted by (priority, distance) or distance alone
+        if not indices: return []
+        if np is not None:
+            idx = np.asarray(indices, dtype=np.int64)
+            idx = idx[(available[idx] > 0) & (percentage_full[idx] < full_threshold)]
+            if not len(idx): return []
+            distances = self.distances_km(lat, lon, idx)
+            order = np.argsort(distances, kind="stable") if rank_by_distance else np.lexsort((distances, self.priorities[idx]))
+            return [(int(idx[o]), float(distances[o])) for o in order]
+        idx = [i for i in indices if available[i] > 0 and percentage_full[i] < full_threshold]
+        distances = self.distances_km(lat, lon, idx)
+        if rank_by_distance: return sorted(zip(idx, distances), key=lambda pair: pair[1])
+        return sorted(zip(idx, distances), key=lambda pair: (self.priorities[pair[0]], pair[1]))
@@ -0,0 +1,41 @@
+# reply_cache.py
+# -*- coding: utf-8 -*-
+
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+from typing import Dict, Hashable, Optional
+
+# body: the serialized JSON bytes sent to the client; next_state: the session the reply leaves behind
+CachedReply = namedtuple("CachedReply", ["body", "etag", "next_state"])
+
+
+def body_etag(body: bytes) -> str:
+    return hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+class ReplyCache:
+    """Bounded LRU of fully serialized /ask replies, keyed by ``BotLogic.reply_cache_key``."""
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[CachedReply]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None: self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Hashable, body: bytes, next_state: Dict) -> CachedReply:
+        entry = CachedReply(body, body_etag(body), dict(next_state))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,217 @@
+# session_store.py
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import hmac
+import time
+import base64
+import hashlib
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Only these fields are persisted, so a session costs two short strings plus an expiry timestamp.
+SESSION_FIELDS = ("lang", "menu_level")
+DEFAULT_SESSION_TTL_SECONDS = 6 * 3600
+
+
+class SessionStore(ABC):
+    """Dict-like store mapping user_id -> {"lang": ..., "menu_level": ...}.
+
+    Values are returned as fresh dicts; callers must write a state back with
+    ``store[user_id] = state`` for a change to persist.
+    """
+
+    @abstractmethod
+    def get(self, user_id: str, default=None) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    def __setitem__(self, user_id: str, state: Dict):
+        ...
+
+    @abstractmethod
+    def __delitem__(self, user_id: str):
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    def __getitem__(self, user_id: str) -> Dict:
+        state = self.get(user_id)
+        if state is None: raise KeyError(user_id)
+        return state
+
+    def __contains__(self, user_id) -> bool:
+        return self.get(user_id) is not None
+
+    def pop(self, user_id: str, default=None):
+        state = self.get(user_id, default)
+        try: del self[user_id]
+        except KeyError: pass
+        return state
+
+
+class InMemorySessionStore(SessionStore):
+    """Per-process LRU store with a sliding TTL. Suitable for a single long-lived worker."""
+
+    def __init__(self, max_entries: int = 200_000, ttl_seconds: float = DEFAULT_SESSION_TTL_SECONDS, clock=time.time):
+        self.max_entries, self.ttl_seconds, self._clock = max_entries, ttl_seconds, clock
+        self._sessions = OrderedDict()  # user_id -> (lang, menu_level, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, user_id, default=None):
+        with self._lock:
+            entry = self._sessions.get(user_id)
+            if entry is None: return default
+            if entry[2] <= self._clock():
+                del self._sessions[user_id]
+                return default
+            self._sessions.move_to_end(user_id)
+        return dict(zip(SESSION_FIELDS, entry[:2]))
+
+    def __setitem__(self, user_id, state):
+        entry = (state.get("lang", "en"), state.get("menu_level", "main_menu"), self._clock() + self.ttl_seconds)
+        with self._lock:
+            self._sessions[user_id] = entry
+            self._sessions.move_to_end(user_id)
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+
+    def __delitem__(self, user_id):
+        with self._lock:
+            del self._sessions[user_id]
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """File-backed store shared by every worker process on the same host (e.g. gunicorn workers, /tmp on a lambda)."""
+
+    PURGE_EVERY_N_WRITES = 1000
+
+    def __init__(self, path: str, ttl_seconds: float = DEFAULT_SESSION_TTL_SECONDS, clock=time.time):
+        self.path, self.ttl_seconds, self._clock = path, ttl_seconds, clock
+        self._local = threading.local()
+        self._writes, self._writes_lock = 0, threading.Lock()
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS sessions (user_id TEXT PRIMARY KEY, lang TEXT NOT NULL, menu_level TEXT NOT NULL, expires_at REAL NOT NULL) WITHOUT ROWID")
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, user_id, default=None):
+        row = self._connection().execute("SELECT lang, menu_level FROM sessions WHERE user_id = ? AND expires_at > ?", (user_id, self._clock())).fetchone()
+        return dict(zip(SESSION_FIELDS, row)) if row else default
+
+    def __setitem__(self, user_id, state):
+        now = self._clock()
+        self._connection().execute(
+            "INSERT OR REPLACE INTO sessions (user_id, lang, menu_level, expires_at) VALUES (?, ?, ?, ?)",
+            (user_id, state.get("lang", "en"), state.get("menu_level", "main_menu"), now + self.ttl_seconds))
+        with self._writes_lock:
+            self._writes += 1
+            purge = self._writes % self.PURGE_EVERY_N_WRITES == 0
+        if purge: self.purge_expired(now)
+
+    def __delitem__(self, user_id):
+        if self._connection().execute("DELETE FROM sessions WHERE user_id = ?", (user_id,)).rowcount == 0:
+            raise KeyError(user_id)
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM sessions WHERE expires_at > ?", (self._clock(),)).fetchone()[0]
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        removed = self._connection().execute("DELETE FROM sessions WHERE expires_at <= ?", (self._clock() if now is None else now,)).rowcount
+        if removed: logger.info(f"Purged {removed} expired sessions from {self.path}")
+        return removed
+
+
+class CarriedSessionStore(SessionStore):
+    """Holds the one session a request carried in with it (see SessionTokenSigner); nothing outlives the request.
+
+    Seed it with the decoded state, pass it to ``BotLogic.process_user_input`` and read the updated
+    state back with ``get`` to issue the next token.
+    """
+
+    def __init__(self, user_id: Optional[str] = None, state: Optional[Dict] = None):
+        self._user_id, self._state = user_id, (dict(state) if state else None)
+
+    def get(self, user_id, default=None):
+        if user_id != self._user_id or self._state is None: return default
+        return dict(self._state)
+
+    def __setitem__(self, user_id, state):
+        self._user_id, self._state = user_id, {field: state.get(field) for field in SESSION_FIELDS}
+
+    def __delitem__(self, user_id):
+        if user_id != self._user_id or self._state is None: raise KeyError(user_id)
+        self._state = None
+
+    def __len__(self):
+        return int(self._state is not None)
+
+
+class SessionTokenSigner:
+    """Encodes a session as ``<lang>.<menu_level>.<signature>`` with a truncated HMAC-SHA256.
+
+    Tokens are deterministic (no timestamp or nonce): the state is not secret and replaying an old
+    token only takes its holder back a step in their own conversation.
+    """
+
+    SIGNATURE_BYTES = 12
+    _FIELD = re.compile(r"^[a-z_]{1,32}$")
+
+    def __init__(self, secret: str):
+        # Derived key, so tokens can't be confused with anything else signed by the same secret (e.g. Flask cookies)
+        self._key = hashlib.sha256(b"tirubot-session-token:" + secret.encode("utf-8")).digest()
+
+    def _signature(self, payload: str) -> str:
+        digest = hmac.new(self._key, payload.encode("ascii"), hashlib.sha256).digest()[:self.SIGNATURE_BYTES]
+        return base64.urlsafe_b64encode(digest).decode("ascii").rstrip("=")
+
+    def sign(self, state: Optional[Dict]) -> Optional[str]:
+        if not state: return None
+        values = [str(state.get(field, "")) for field in SESSION_FIELDS]
+        if not all(self._FIELD.match(value) for value in values): return None
+        payload = ".".join(values)
+        return f"{payload}.{self._signature(payload)}"
+
+    def verify(self, token) -> Optional[Dict]:
+        # The session the token encodes, or None if it is malformed or was not signed with our secret
+        if not isinstance(token, str): return None
+        payload, _, signature = token.rpartition(".")
+        values = payload.split(".")
+        if len(values) != len(SESSION_FIELDS) or not all(self._FIELD.match(value) for value in values): return None
+        if not hmac.compare_digest(signature, self._signature(payload)): return None
+        return dict(zip(SESSION_FIELDS, values))
+
+
+def create_session_store_from_env() -> SessionStore:
+    backend = os.getenv("SESSION_STORE", "memory").lower()
+    if backend == "token":
+        # State travels with each request (app.py); this store only serves callers that don't send a token
+        backend = "memory"
+    ttl = float(os.getenv("SESSION_TTL_SECONDS", DEFAULT_SESSION_TTL_SECONDS))
+    if backend == "sqlite":
+        path = os.getenv("SESSION_STORE_PATH", "/tmp/tirubot_sessions.sqlite3")
+        logger.info(f"Using SQLite session store at {path}")
+        return SQLiteSessionStore(path, ttl_seconds=ttl)
+    if backend != "memory":
+        logger.warning(f"Unknown SESSION_STORE '{backend}'; falling back to in-memory sessions.")
+    return InMemorySessionStore(max_entries=int(os.getenv("SESSION_MAX_ENTRIES", 200_000)), ttl_seconds=ttl)
@@ -0,0 +1,201 @@
+# sheets_guard.py
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import random
+import logging
+import threading
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Google's read quota is 60 requests/minute per user (our service account); stay under it with headroom
+DEFAULT_RATE_PER_MINUTE = 50
+DEFAULT_BURST = 10
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+# The request itself was wrong (a bad range, a missing spreadsheet); says nothing about the API's health. 401/403 are
+# not here: a revoked grant fails every call, and the open circuit is what stops re-authorizing on each request.
+CLIENT_ERROR_STATUSES = frozenset({400, 404})
+
+
+class SheetsUnavailable(Exception):
+    """Raised instead of calling the API when the rate limiter or circuit breaker refuses a request."""
+
+    def __init__(self, key: str, reason: str):
+        super().__init__(f"Sheets access to {key} refused: {reason}")
+        self.key, self.reason = key, reason
+
+
+def api_status(error: Exception):
+    # HTTP status of a gspread APIError (or anything else carrying a requests-style response), else None. gspread's
+    # open_by_key re-raises 404 as SpreadsheetNotFound and 403 as a bare PermissionError, chained from the APIError.
+    while error is not None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+        if status is not None: return status
+        error = error.__cause__
+    return None
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try: return float(headers.get("Retry-After"))
+    except (TypeError, ValueError): return None
+
+
+class TokenBucket:
+    """Request budget refilled continuously at ``rate_per_minute``, holding at most ``burst`` tokens."""
+
+    def __init__(self, rate_per_minute: float = DEFAULT_RATE_PER_MINUTE, burst: float = DEFAULT_BURST, clock=time.monotonic):
+        self.rate_per_second, self.burst, self._clock = rate_per_minute / 60.0, float(burst), clock
+        self._tokens, self._updated_at = float(burst), clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate_per_second)
+        self._updated_at = now
+
+    def try_acquire(self, cost: float = 1) -> bool:
+        with self._lock:
+            self._refill()
+            if self._tokens < cost: return False
+            self._tokens -= cost
+            return True
+
+    def remaining(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures; after a cool-down one probe call is let through.
+
+    Each time a probe fails the cool-down doubles (with jitter) up to ``max_reset_timeout``.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0, max_reset_timeout: float = 600.0, clock=time.monotonic, rng=random.random):
+        self.failure_threshold, self.reset_timeout, self.max_reset_timeout = failure_threshold, reset_timeout, max_reset_timeout
+        self._clock, self._rng = clock, rng
+        self._state, self._failures, self._trips, self._open_until, self._probe_in_flight = self.CLOSED, 0, 0, 0.0, False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and self._clock() >= self._open_until: return self.HALF_OPEN
+            return self._state
+
+    def is_available(self) -> bool:
+        # Non-mutating check, so callers can skip work (e.g. re-authorizing) while the circuit is open
+        state = self.state
+        return state == self.CLOSED or (state == self.HALF_OPEN and not self._probe_in_flight)
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == self.CLOSED: return True
+            if self._state == self.OPEN:
+                if self._clock() < self._open_until: return False
+                self._state = self.HALF_OPEN
+            if self._probe_in_flight: return False
+            self._probe_in_flight = True
+            return True
+
+    def release(self):
+        # The allowed call never reached the API (e.g. no budget left); let another caller probe
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED: logger.info("Sheets circuit closed again after a successful probe.")
+            self._state, self._failures, self._trips, self._probe_in_flight = self.CLOSED, 0, 0, False
+
+    def record_failure(self, retry_after: Optional[float] = None):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.CLOSED and self._failures < self.failure_threshold: return
+            timeout = min(self.max_reset_timeout, self.reset_timeout * 2 ** self._trips) * (0.5 + self._rng() / 2)
+            if retry_after: timeout = max(timeout, retry_after)
+            self._state, self._open_until, self._trips = self.OPEN, self._clock() + timeout, self._trips + 1
+            logger.warning(f"Sheets circuit opened for {timeout:.0f}s after {self._failures} consecutive failures.")
+
+
+class SheetsGuard:
+    """Gate for every Sheets API call: a shared token bucket, per-spreadsheet circuit breakers and bounded retries.
+
+    ``call`` raises ``SheetsUnavailable`` without touching the API when there is no budget or the
+    circuit is open, so callers fall back to their last good data. 400 and 404 responses are re-raised
+    without counting against the circuit; 401 and 403 count as failures.
+    """
+
+    def __init__(self, rate_per_minute: float = DEFAULT_RATE_PER_MINUTE, burst: float = DEFAULT_BURST, failure_threshold: int = 3,
+                 reset_timeout: float = 30.0, max_retries: int = 2, backoff_base: float = 0.25, backoff_cap: float = 2.0,
+                 clock=time.monotonic, sleep=time.sleep, rng=random.random, on_error: Optional[Callable[[str, object], None]] = None):
+        self.bucket = TokenBucket(rate_per_minute, burst, clock=clock)
+        self.failure_threshold, self.reset_timeout = failure_threshold, reset_timeout
+        self.max_retries, self.backoff_base, self.backoff_cap = max_retries, backoff_base, backoff_cap
+        self._clock, self._sleep, self._rng, self.on_error = clock, sleep, rng, on_error
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._breakers_lock = threading.Lock()
+
+    def breaker(self, key: str) -> CircuitBreaker:
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._breakers_lock:
+                breaker = self._breakers.setdefault(key, CircuitBreaker(self.failure_threshold, self.reset_timeout, clock=self._clock, rng=self._rng))
+        return breaker
+
+    def is_available(self, key: str) -> bool:
+        return self.breaker(key).is_available()
+
+    def remaining_budget(self) -> float:
+        return self.bucket.remaining()
+
+    def circuit_states(self) -> Dict[str, str]:
+        return {key: breaker.state for key, breaker in list(self._breakers.items())}
+
+    def backoff_delay(self, attempt: int) -> float:
+        # "Full jitter": uniform in [0, min(cap, base * 2^attempt)]
+        return self._rng() * min(self.backoff_cap, self.backoff_base * 2 ** attempt)
+
+    def call(self, key: str, fn: Callable, cost: float = 1):
+        breaker = self.breaker(key)
+        if not breaker.allow():
+            raise SheetsUnavailable(key, "circuit_open")
+        for attempt in range(self.max_retries + 1):
+            if not self.bucket.try_acquire(cost):
+                breaker.release()
+                raise SheetsUnavailable(key, "rate_limited")
+            try:
+                result = fn()
+            except Exception as e:
+                status = api_status(e)
+                if self.on_error: self.on_error(key, status if status is not None else "exception")
+                if status in CLIENT_ERROR_STATUSES:
+                    breaker.release()
+                    raise
+                if status in RETRYABLE_STATUSES and attempt < self.max_retries:
+                    delay = max(self.backoff_delay(attempt), _retry_after_seconds(e) or 0)
+                    if delay <= self.backoff_cap:  # A longer Retry-After is left to the circuit breaker
+                        logger.info(f"Sheets call for {key} failed with {status}; retrying in {delay:.2f}s.")
+                        self._sleep(delay)
+                        continue
+                breaker.record_failure(_retry_after_seconds(e))
+                raise
+            breaker.record_success()
+            return result
+
+
+def create_sheets_guard_from_env(**kwargs) -> SheetsGuard:
+    return SheetsGuard(
+        rate_per_minute=float(os.getenv("SHEETS_RATE_LIMIT_PER_MINUTE", DEFAULT_RATE_PER_MINUTE)),
+        burst=float(os.getenv("SHEETS_RATE_LIMIT_BURST", DEFAULT_BURST)),
+        failure_threshold=int(os.getenv("SHEETS_BREAKER_FAILURES", 3)),
+        reset_timeout=float(os.getenv("SHEETS_BREAKER_COOLDOWN_SECONDS", 30)),
+        max_retries=int(os.getenv("SHEETS_MAX_RETRIES", 2)),
+        **kwargs)
@@ -0,0 +1,195 @@
+# tests/test_concurrency.py
+# -*- coding: utf-8 -*-
+#
+# Stress tests for BotLogic under concurrent use: many threads drive many user sessions through
+# process_user_input while caches are refreshed and parking deltas arrive. Run with `python -m pytest tests`.
+
+import os
+import sys
+import time
+import random
+import tempfile
+import threading
+import unittest
+
+os.environ["SHEET_SNAPSHOT_PATH"] = ""
+os.environ["SESSION_STORE"] = "memory"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot_logic import (BotLogic, LOCAL_INFO_WORKSHEETS, GOOGLE_SHEET_LOCAL_INFO_NAME, GOOGLE_SHEET_PARKING_LOTS_INFO_NAME,
+                       GOOGLE_SHEET_PARKING_STATUS_LIVE_NAME)
+from sheets_guard import SheetsGuard
+
+THREADS = 32
+USERS = 256
+# Every menu, free text included; ends mid-conversation so each user's final session state can be compared
+SCRIPT = ["start", "en", "3", "1", "2", "2", "1", "0", "6", "toilets", "1", "tuticorin", "10", "ta", "5", "7", "1", "Tirunelveli 2", "2", "3"]
+
+
+class StubSheets:
+    """In-memory spreadsheets behind the subset of the gspread client BotLogic uses; counts API calls."""
+
+    def __init__(self, latency: float = 0.0, lots: int = 20):
+        self.latency, self.calls, self._lock = latency, {}, threading.Lock()
+        rnd = random.Random(3)
+        self.data = {
+            GOOGLE_SHEET_LOCAL_INFO_NAME: {ws: [{"Name_en": f"{ws} {i}", "Name_ta": f"{ws} {i}", "Notes_en": "Open"} for i in range(5)] for ws in LOCAL_INFO_WORKSHEETS},
+            GOOGLE_SHEET_PARKING_LOTS_INFO_NAME: {"Sheet1": [{"ParkingLotID": i, "Parking_name_en": f"Lot {i}", "Latitude": 8.4 + rnd.random() * 0.2,
+                                                              "Longitude": 78.0 + rnd.random() * 0.2, "TotalCapacity": 500, "Priority": rnd.randint(1, 3),
+                                                              "Route_en": rnd.choice(["Tirunelveli", "Thoothukudi", "Nagercoil"])} for i in range(lots)]},
+            GOOGLE_SHEET_PARKING_STATUS_LIVE_NAME: {"Sheet1": [{"ParkingLotID": i, "CurrentIn": 100, "CurrentOut": 40, "CurrentAvailability": ""} for i in range(lots)]},
+        }
+
+    def call(self, what: str):
+        with self._lock:
+            self.calls[what] = self.calls.get(what, 0) + 1
+        if self.latency: time.sleep(self.latency)
+
+    # gspread client
+    def open(self, name: str):
+        self.call("open")
+        return StubSpreadsheet(self, name)
+
+    def open_by_key(self, key: str):
+        return self.open(key)
+
+
+class StubSpreadsheet:
+    def __init__(self, sheets: StubSheets, name: str):
+        self._sheets, self.id = sheets, name
+
+    def values_batch_get(self, ranges, params=None):
+        self._sheets.call("values_batch_get")
+        value_ranges = []
+        for r in ranges:
+            records = self._sheets.data[self.id][r.split("!")[0].strip("'")]
+            headers = list(records[0]) if records else []
+            value_ranges.append({"values": [headers] + [[str(record[h]) for h in headers] for record in records] if records else []})
+        return {"valueRanges": value_ranges}
+
+
+def make_bot(sheets: StubSheets, **kwargs) -> BotLogic:
+    return BotLogic(gspread_client=sheets, snapshot_path=kwargs.pop("snapshot_path", ""), sheets_guard=SheetsGuard(rate_per_minute=1e6, burst=1e6), **kwargs)
+
+
+def run_threads(target, count: int):
+    # Runs target(i) on `count` threads started together; returns the exceptions they raised
+    errors, barrier = [], threading.Barrier(count)
+
+    def run(i):
+        try:
+            barrier.wait()
+            target(i)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    return errors
+
+
+class ConcurrentSessionsTest(unittest.TestCase):
+    def test_sessions_match_a_sequential_run_while_caches_refresh(self):
+        reference_bot = make_bot(StubSheets())
+        expected = [reference_bot.process_user_input("ref", "text", message)["text"] for message in SCRIPT]
+        expected_state = reference_bot.user_states.get("ref")
+
+        bot = make_bot(StubSheets())
+        bot.LIVE_DATA_CACHE_DURATION = 0.01  # Requests keep finding live parking data stale and refresh it themselves
+        replies, stop = {}, threading.Event()
+
+        def refresher():
+            # Forced swaps of every cache and of the client, racing the readers
+            while not stop.is_set():
+                bot.fetch_all_local_info(force_refresh=True)
+                bot.fetch_parking_lots_info(force_refresh=True)
+                bot.fetch_parking_live_status(force_refresh=True)
+
+        def converse(i):
+            for user in range(i, USERS, THREADS):
+                user_id = f"user-{user}"
+                replies[user_id] = [bot.process_user_input(user_id, "text", message)["text"] for message in SCRIPT]
+
+        background = threading.Thread(target=refresher)
+        background.start()
+        try:
+            errors = run_threads(converse, THREADS)
+        finally:
+            stop.set()
+            background.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(replies), USERS)
+        for user_id, texts in replies.items():
+            self.assertEqual(texts, expected, user_id)
+            self.assertEqual(bot.user_states.get(user_id), expected_state, user_id)
+        self.assertEqual(len(bot.user_states), USERS)
+        # Every cache swap published its records and version together
+        self.assertEqual(set(bot.LOCAL_INFO_CACHE), set(bot.LOCAL_INFO_VERSION))
+        for (worksheet_name, _), (version, _) in bot._local_info_render_cache.items():
+            self.assertLessEqual(version, bot.LOCAL_INFO_VERSION[worksheet_name])
+
+    def test_concurrent_misses_coalesce_into_one_fetch(self):
+        sheets = StubSheets()
+        bot = make_bot(sheets)
+        bot.LOCAL_INFO_CACHE_DURATION = 0.05
+        time.sleep(0.1)
+        sheets.latency, before = 0.1, sheets.calls.get("values_batch_get", 0)
+        errors = run_threads(lambda i: bot.fetch_local_info_from_sheet(LOCAL_INFO_WORKSHEETS[0]), THREADS)
+        self.assertEqual(errors, [])
+        self.assertEqual(sheets.calls["values_batch_get"] - before, 1)
+
+    def test_authorization_is_single_flight(self):
+        bot = make_bot(StubSheets(), preload=False)
+        bot.gspread_client, authorizations = None, []
+
+        def authorize(force_reauth):
+            authorizations.append(force_reauth)
+            time.sleep(0.05)
+            bot.gspread_client = StubSheets()
+            return bot.gspread_client
+
+        bot._authorize_gspread_client = authorize
+        clients = []
+        errors = run_threads(lambda i: clients.append(bot.get_gspread_client()), THREADS)
+        self.assertEqual(errors, [])
+        self.assertEqual(len(authorizations), 1)
+        self.assertEqual(len({id(client) for client in clients}), 1)
+
+
+class ConcurrentParkingDeltasTest(unittest.TestCase):
+    def test_no_delta_is_lost_under_concurrent_readers_and_snapshots(self):
+        sheets = StubSheets()
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            bot = make_bot(sheets, snapshot_path=os.path.join(snapshot_dir, "snapshot.json"))
+            lot_ids = sorted(bot.PARKING_LIVE_STATUS_CACHE)
+            before = {lot_id: int(bot.PARKING_LIVE_STATUS_CACHE[lot_id]["CurrentIn"]) for lot_id in lot_ids}
+            per_thread, sent = 200, [[] for _ in range(THREADS)]
+
+            def push_or_read(i):
+                rnd = random.Random(i)
+                if i % 4 == 0:  # Readers: parking replies and snapshot writes iterate the live dict while it is swapped
+                    for n in range(per_thread // 4):
+                        bot.process_user_input(f"reader-{i}", "text", ["start", "en", "1", "2"][n % 4])
+                        bot._save_snapshot()
+                    return
+                for _ in range(per_thread):
+                    lot_id = rnd.choice(lot_ids)
+                    result = bot.apply_parking_deltas([{"ParkingLotID": lot_id, "CurrentIn": 1}])
+                    self.assertEqual(result["applied"], 1)
+                    sent[i].append(lot_id)
+
+            errors = run_threads(push_or_read, THREADS)
+            self.assertEqual(errors, [])
+            live = bot.PARKING_LIVE_STATUS_CACHE
+            for lot_id in lot_ids:
+                pushed = sum(ids.count(lot_id) for ids in sent)
+                self.assertEqual(int(live[lot_id]["CurrentIn"]), before[lot_id] + pushed, lot_id)
+            # The incrementally patched availability agrees with a full recomputation
+            index, available, percentage_full = bot._get_parking_availability()
+            self.assertEqual([int(v) for v in available], [int(v) for v in index.availability(live)[0]])
+
+
+if __name__ == "__main__":
+    unittest.main()